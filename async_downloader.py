@@ -0,0 +1,394 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Iterable, Optional
+
+try:
+    import aiohttp
+except ImportError:  # The threaded MediaDownloader works without it
+    aiohttp = None
+
+from file_transfer import preallocate
+from media_downloader import DOWNLOAD_METHODS, PAGE_MEDIA_PLATFORMS, MediaDownloader
+from metrics import COALESCED_TOTAL, DownloadTrace, annotate, stage
+from og_meta import DEFAULT_HEADERS, PageHeadReader, PageMetadata
+from single_flight import AsyncSingleFlight, FileLock
+from transfer_scheduler import priority_class
+
+# Statuses retried with backoff, as by the requests session in http_session
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class AsyncMediaDownloader:
+    """asyncio front end to a MediaDownloader, for many concurrent downloads.
+
+    The page fetch, the platform fallback handlers and direct file downloads
+    run on one aiohttp session whose connector pools up to
+    ``connection_limit`` connections (``scheduler.host_connections`` per
+    host), so thousands of fallback downloads can be in flight on one event
+    loop without a thread each.  yt-dlp, pytube, YouTube metadata and the
+    index still block, so they run on a pool of ``blocking_workers``
+    threads.  The steps between them, the result strings and the metrics
+    come from the wrapped ``downloader``'s helpers, and its index, router,
+    metadata cache, bandwidth caps and output directory are shared with its
+    threaded callers.
+    """
+
+    def __init__(self, downloader: Optional[MediaDownloader] = None, connection_limit: int = 1000,
+                 blocking_workers: int = 32, retries: int = 3, backoff_factor: float = 0.5,
+                 session_factory: Optional[Callable[[], "aiohttp.ClientSession"]] = None):
+        if aiohttp is None:
+            raise RuntimeError("The asyncio engine needs aiohttp, which is not installed "
+                               "(install it with 'pip install aiohttp')")
+        self.downloader = downloader or MediaDownloader()
+        self.connection_limit = connection_limit
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.session_factory = session_factory or self._build_session
+        self.flights = AsyncSingleFlight()
+        self._session = None
+        self._executor = ThreadPoolExecutor(max_workers=blocking_workers, thread_name_prefix="async-blocking")
+
+    def _build_session(self) -> "aiohttp.ClientSession":
+        connector = aiohttp.TCPConnector(limit=self.connection_limit,
+                                         limit_per_host=self.downloader.scheduler.host_connections,
+                                         ttl_dns_cache=300)
+        return aiohttp.ClientSession(connector=connector,
+                                     timeout=aiohttp.ClientTimeout(sock_connect=10, sock_read=60))
+
+    @property
+    def session(self) -> "aiohttp.ClientSession":
+        """The shared aiohttp session, created on first use inside the event loop."""
+        if self._session is None or self._session.closed:
+            self._session = self.session_factory()
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+        self._executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+        return False
+
+    @asynccontextmanager
+    async def _get(self, url: str, **kwargs) -> AsyncIterator["aiohttp.ClientResponse"]:
+        """GET ``url``, retrying connection errors and 429/5xx replies with exponential backoff."""
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self.session.get(url, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    raise
+            else:
+                if response.status not in RETRY_STATUSES or attempt == self.retries:
+                    break
+                response.release()
+            await asyncio.sleep(self.backoff_factor * 2 ** attempt)
+        try:
+            yield response
+        finally:
+            response.release()
+
+    async def _in_thread(self, func: Callable, *args):
+        """Run a blocking call on the thread pool, keeping the current trace and priority."""
+        context = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(context.run, func, *args))
+
+    async def download(self, url: str, selected_quality: str = "7", output_name: Optional[str] = None,
+                       progress: Optional[Callable[[dict], None]] = None, priority: str = "interactive") -> str:
+        """Async ``MediaDownloader.download``, with the same result strings and metrics."""
+        with priority_class(priority), DownloadTrace(url, hook=self.downloader.trace_hook) as trace:
+            result = await self._download(url, selected_quality, output_name, progress)
+            self.downloader._finish_trace(trace, result)
+        return result
+
+    async def download_many(self, urls: Iterable[str], selected_quality: str = "7", concurrency: int = 1000,
+                            priority: str = "bulk") -> AsyncIterator[dict]:
+        """Download every URL with at most ``concurrency`` in flight; yield results as they finish.
+
+        Result dicts have the same fields as ``BatchDownloader.run`` yields.
+        """
+        async def run_one(url: str) -> dict:
+            started = time.monotonic()
+            item = {"url": url, "platform": None}
+            try:
+                item["platform"] = self.downloader.detect_platform(url)
+                result = await self.download(url, selected_quality, priority=priority)
+                if self.downloader._resolve_result_path(result):
+                    item["result"] = result
+                    item["status"] = "finished"
+                else:
+                    item["error"] = result
+                    item["status"] = "failed"
+            except Exception as e:
+                item["error"] = str(e)
+                item["status"] = "failed"
+            item["elapsed"] = round(time.monotonic() - started, 3)
+            return item
+
+        pending = set()
+        for url in urls:
+            if len(pending) >= concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+            pending.add(asyncio.ensure_future(run_one(url)))
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+
+    async def _download(self, url: str, selected_quality: str, output_name: Optional[str],
+                        progress: Optional[Callable[[dict], None]]) -> str:
+        downloader = self.downloader
+        platform, url, key = downloader._identify(url)
+        if output_name:
+            return await self._fetch(url, platform, key, selected_quality, output_name, progress)
+
+        cached = await self._in_thread(downloader._lookup_index, key, selected_quality, url)
+        if cached:
+            return cached
+
+        flight_key = f"{key}@{selected_quality}"
+
+        async def work(publish):
+            async with FileLock(downloader.lock_dir, flight_key, timeout=downloader.lock_timeout):
+                # Another task or worker may have finished it since the check above
+                cached = await self._in_thread(downloader._lookup_index, key, selected_quality, url)
+                if cached:
+                    COALESCED_TOTAL.inc(platform=platform, scope="worker")
+                    return cached
+                return await self._fetch(url, platform, key, selected_quality, None, publish)
+
+        result, shared = await self.flights.run(flight_key, work, progress)
+        if shared:
+            annotate(method="coalesced")
+            COALESCED_TOTAL.inc(platform=platform, scope="process")
+        return result
+
+    async def _fetch(self, url: str, platform: str, key: str, selected_quality: str, output_name: Optional[str],
+                     progress: Optional[Callable[[dict], None]]) -> str:
+        downloader = self.downloader
+        page = None
+        if platform in PAGE_MEDIA_PLATFORMS and not output_name:
+            try:
+                with stage("page_fetch", method="http"):
+                    page = await self.fetch_page_metadata(url)
+            except Exception as e:
+                print(f"Could not fetch preliminary data: {e}")
+
+        if not output_name:
+            with stage("filename"):
+                if platform == "youtube":
+                    # Runs yt-dlp for the title
+                    output_name = await self._in_thread(downloader.get_original_filename, url, platform, page)
+                else:
+                    output_name = downloader.get_original_filename(url, platform, page)
+
+        output_path = downloader._output_path(platform, output_name)
+        result = await self._run_download_methods(url, platform, output_path, page, selected_quality, progress)
+        # Checksums the file and writes SQLite, so keep it off the event loop
+        await self._in_thread(downloader._index_result, key, selected_quality, url, result)
+        return result
+
+    async def _run_download_methods(self, url: str, platform: str, output_path: str,
+                                    page: Optional[PageMetadata], selected_quality: str,
+                                    progress: Optional[Callable[[dict], None]] = None) -> str:
+        """Try yt-dlp and the fallback in the router's order, as the threaded downloader does."""
+        downloader = self.downloader
+        result = None
+        error = None
+        for method in downloader.router.order(platform, DOWNLOAD_METHODS):
+            if not downloader.router.begin(platform, method):
+                continue
+            started = time.monotonic()
+            if method == "ytdlp":
+                try:
+                    result = await self._in_thread(downloader._use_youtube_dl, url, output_path,
+                                                   selected_quality, progress)
+                    success = True
+                except Exception as e:
+                    print(f"youtube-dl method failed: {e}")
+                    error = e
+                    success = False
+            else:
+                with downloader._fallback_stage(platform) as span:
+                    result = await self._run_fallback(url, platform, output_path, page)
+                    success = downloader._fallback_succeeded(span, result)
+            downloader._record_attempt(platform, method, success, started)
+            if success:
+                return result
+        if result is None:
+            return f"All download methods failed: {error}"
+        return result
+
+    async def _run_fallback(self, url: str, platform: str, output_path: str, page: Optional[PageMetadata]) -> str:
+        if platform == "instagram":
+            return await self.download_instagram(url, output_path, page)
+        elif platform == "facebook":
+            return await self.download_facebook(url, output_path, page)
+        elif platform == "twitter":
+            return await self.download_twitter(url, output_path, page)
+        elif platform == "tiktok":
+            return await self.download_tiktok(url, output_path)
+        elif platform == "pinterest":
+            return self.downloader.download_pinterest(url, output_path)
+        elif platform == "reddit":
+            return await self.download_reddit(url, output_path, page)
+        elif platform == "youtube":
+            try:
+                return await self._in_thread(self.downloader.download_youtube, url, output_path)
+            except Exception as e2:
+                return f"All download methods failed: {e2}"
+
+    async def _download_page_media(self, url: str, output_path: str, page: Optional[PageMetadata],
+                                   platform: str) -> str:
+        downloader = self.downloader
+        try:
+            if page is None:
+                page = await self.fetch_page_metadata(url)
+            target = downloader._page_media_target(platform, page, output_path)
+            if target:
+                await self.download_file(target[0], target[1])
+            return downloader._page_media_result(platform, target)
+        except Exception as e:
+            return downloader._page_media_result(platform, error=e)
+
+    async def download_instagram(self, url: str, output_path: str, page: Optional[PageMetadata] = None) -> str:
+        """Async ``MediaDownloader.download_instagram``."""
+        return await self._download_page_media(url, output_path, page, "instagram")
+
+    async def download_facebook(self, url: str, output_path: str, page: Optional[PageMetadata] = None) -> str:
+        """Async ``MediaDownloader.download_facebook``."""
+        return await self._download_page_media(url, output_path, page, "facebook")
+
+    async def download_twitter(self, url: str, output_path: str, page: Optional[PageMetadata] = None) -> str:
+        """Async ``MediaDownloader.download_twitter``."""
+        return await self._download_page_media(url, output_path, page, "twitter")
+
+    async def download_reddit(self, url: str, output_path: str, page: Optional[PageMetadata] = None) -> str:
+        """Async ``MediaDownloader.download_reddit``."""
+        return await self._download_page_media(url, output_path, page, "reddit")
+
+    async def download_tiktok(self, url: str, output_path: str) -> str:
+        """Async ``MediaDownloader.download_tiktok``."""
+        try:
+            video_url = await self.resolve_tiktok_video(url)
+            video_path = None
+            if video_url:
+                video_path = f"{output_path}.mp4"
+                await self.download_file(video_url, video_path)
+            return self.downloader._tiktok_result(video_path)
+        except Exception as e:
+            return self.downloader._tiktok_result(error=e)
+
+    async def fetch_page_metadata(self, url: str, max_bytes: int = 512 * 1024,
+                                  chunk_size: int = 16 * 1024) -> PageMetadata:
+        """Fetch only the head of a post page and collect its og:/twitter: tags."""
+        async with self._get(url, headers=DEFAULT_HEADERS) as response:
+            reader = PageHeadReader(url, response.charset, max_bytes)
+            async for chunk in response.content.iter_chunked(chunk_size):
+                if reader.feed(chunk):
+                    return reader.page
+        return reader.finish()
+
+    async def resolve_tiktok_video(self, url: str) -> Optional[str]:
+        """Look up the direct video URL of a TikTok post through the tikwm API."""
+        async with self._get("https://www.tikwm.com/api/", params={"url": url}) as response:
+            data = await response.json(content_type=None)
+        if data.get("success"):
+            return data.get("data", {}).get("play")
+        return None
+
+    async def download_file(self, url: str, output_path: str, priority: Optional[str] = None) -> int:
+        """Async ``file_transfer.stream_download``; returns the size written.
+
+        The body is collected into ``downloader.buffer_size`` writes to a
+        preallocated ``<output>.part`` that is renamed into place once
+        complete.  The transfer holds one of the scheduler's connection slots
+        on the host, shared with threaded downloads, and every chunk is
+        charged to its bandwidth caps with the wait slept on the event loop.
+        Files are fetched over one connection; segmenting is left to the
+        threaded downloader.
+        """
+        scheduler = self.downloader.scheduler
+        buffer_size = self.downloader.buffer_size
+        part_path = f"{output_path}.part"
+        completed = False
+        try:
+            async with scheduler.async_transfer(url, priority) as transfer, self._get(url) as response:
+                response.raise_for_status()
+                total_size = response.content_length
+                # Content-Length counts encoded bytes when the body is compressed
+                encoded = response.headers.get('Content-Encoding', 'identity') != 'identity'
+                written = 0
+                pending = bytearray()
+                with open(part_path, 'wb') as file:
+                    if total_size and not encoded:
+                        preallocate(file, total_size)
+                    async for chunk in response.content.iter_any():
+                        pending += chunk
+                        if len(pending) >= buffer_size:
+                            file.write(pending)
+                            written += len(pending)
+                            pending.clear()
+                        wait = scheduler.reserve(transfer.host, transfer.priority, len(chunk))
+                        if wait:
+                            await asyncio.sleep(wait)
+                    file.write(pending)
+                    written += len(pending)
+                    file.truncate(written)
+            if total_size and not encoded and written != total_size:
+                raise IOError(f"Download ended early: got {written} of {total_size} bytes")
+            os.replace(part_path, output_path)
+            completed = True
+            return written
+        except aiohttp.ClientError as e:
+            print(f"Download failed: {e}")
+            raise
+        except IOError as e:
+            print(f"IOError: {e}")
+            raise
+        finally:
+            if not completed and os.path.exists(part_path):
+                os.remove(part_path)
+
+
+class BlockingAsyncDownloader:
+    """Runs an AsyncMediaDownloader on a background event loop for threaded callers.
+
+    ``download`` blocks the calling thread until the coroutine finishes, so
+    this drops in wherever a MediaDownloader is used (the web app's job
+    queue and batch runner).  Every other attribute is the wrapped
+    downloader's.
+    """
+
+    def __init__(self, downloader: Optional[MediaDownloader] = None, **kwargs):
+        self.engine = AsyncMediaDownloader(downloader, **kwargs)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="async-downloader", daemon=True)
+        self._thread.start()
+
+    def download(self, url: str, selected_quality: str = "7", output_name: Optional[str] = None,
+                 progress: Optional[Callable[[dict], None]] = None, priority: str = "interactive") -> str:
+        coroutine = self.engine.download(url, selected_quality, output_name, progress, priority)
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.engine.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def __getattr__(self, name):
+        return getattr(self.engine.downloader, name)
@@ -0,0 +1,145 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, Optional
+
+# Concurrent downloads allowed per platform, shared by every running batch
+DEFAULT_PLATFORM_LIMITS = {
+    "youtube": 4,
+    "instagram": 2,
+    "facebook": 2,
+    "twitter": 3,
+    "tiktok": 3,
+    "reddit": 3,
+    "pinterest": 2,
+}
+
+
+def read_urls(lines: Iterable[str]) -> Iterator[str]:
+    """Yield URLs from text lines, skipping blanks and ``#`` comments."""
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+class BatchDownloader:
+    """Run many downloads concurrently with a separate cap per platform.
+
+    All batches share one thread pool of ``max_workers`` and one set of
+    per-platform counters, so two large batches together still never exceed
+    the cap for any platform.  The input is read on its own thread, so each
+    URL is dispatched as soon as it is produced (a slow playlist listing
+    never holds back downloads or results), and at most ``max_workers * 4``
+    URLs wait for a worker.  Results are yielded in completion order.  Downloads run in the transfer
+    scheduler's bulk class, so they yield to interactive requests.
+    """
+
+    def __init__(self, downloader, max_workers: int = 8, platform_limits: Optional[dict] = None):
+        self.downloader = downloader
+        self.max_workers = max_workers
+        self.platform_limits = dict(DEFAULT_PLATFORM_LIMITS)
+        self.platform_limits.update(platform_limits or {})
+        self._active = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch-worker")
+
+    def _try_start(self, platform: str) -> bool:
+        """Reserve a slot for one download on a platform if the cap allows it."""
+        with self._lock:
+            active = self._active.get(platform, 0)
+            if active >= self.platform_limits.get(platform, 1):
+                return False
+            self._active[platform] = active + 1
+            return True
+
+    def _run_one(self, url: str, platform: str, selected_quality: str, events: queue.Queue):
+        started = time.monotonic()
+        item = {"url": url, "platform": platform}
+        try:
+            result = self.downloader.download(url, selected_quality, priority="bulk")
+            # Failures also come back as result strings; only a file on disk counts as done
+            if self.downloader._resolve_result_path(result):
+                item["result"] = result
+                item["status"] = "finished"
+            else:
+                item["error"] = result
+                item["status"] = "failed"
+        except Exception as e:
+            item["error"] = str(e)
+            item["status"] = "failed"
+        finally:
+            with self._lock:
+                self._active[platform] -= 1
+            item["elapsed"] = round(time.monotonic() - started, 3)
+            events.put(("result", item))
+
+    def _read_source(self, urls: Iterable[str], events: queue.Queue, room: threading.Semaphore,
+                     stop: threading.Event):
+        """Pass URLs to ``run`` as the source yields them, holding one unit of ``room`` per URL."""
+        try:
+            for url in urls:
+                while not room.acquire(timeout=0.5):
+                    if stop.is_set():
+                        return
+                if stop.is_set():
+                    return
+                events.put(("url", url))
+        except Exception as e:
+            events.put(("error", e))
+        else:
+            events.put(("done", None))
+
+    def run(self, urls: Iterable[str], selected_quality: str = "7") -> Iterator[dict]:
+        """Download every URL and yield one result dict per URL as it finishes.
+
+        Errors raised by ``urls`` itself are raised here.
+        """
+        events = queue.Queue()
+        room = threading.Semaphore(self.max_workers * 4)
+        stop = threading.Event()
+        threading.Thread(target=self._read_source, args=(urls, events, room, stop), name="batch-source",
+                         daemon=True).start()
+        pending = {}
+        waiting = 0
+        in_flight = 0
+        exhausted = False
+
+        try:
+            while True:
+                for platform, platform_urls in pending.items():
+                    while platform_urls and self._try_start(platform):
+                        self._executor.submit(self._run_one, platform_urls.popleft(), platform,
+                                              selected_quality, events)
+                        room.release()
+                        waiting -= 1
+                        in_flight += 1
+
+                if exhausted and not waiting and not in_flight:
+                    return
+
+                try:
+                    # Time out so slots freed by other batches are picked up too
+                    kind, value = events.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if kind == "result":
+                    in_flight -= 1
+                    yield value
+                elif kind == "url":
+                    try:
+                        platform = self.downloader.detect_platform(value)
+                    except ValueError as e:
+                        room.release()
+                        yield {"url": value, "platform": None, "status": "failed", "error": str(e), "elapsed": 0.0}
+                        continue
+                    pending.setdefault(platform, deque()).append(value)
+                    waiting += 1
+                elif kind == "error":
+                    raise value
+                else:
+                    exhausted = True
+        finally:
+            stop.set()
@@ -0,0 +1,264 @@
+"""Local stand-ins for the platforms and for yt-dlp, so benchmarks run offline.
+
+``FakePlatformServer`` answers every request the downloader makes.  Paths
+start with the host that was originally requested
+(``/www.instagram.com/p/<id>/``), which ``LocalRedirectAdapter`` arranges
+by rewriting outgoing URLs (``redirect_client_session`` does the same for
+the asyncio engine's aiohttp session).  It serves:
+
+* post pages for Instagram/Facebook/Twitter/Reddit with og: tags in the head
+  followed by a large inline script, like the real sites;
+* a tikwm-style JSON API under ``/www.tikwm.com/api/``;
+* Range-capable media under ``/cdn.bench/media/<bytes>.mp4``.
+
+``install_stub_ytdlp`` writes a fake ``yt-dlp`` executable into a directory
+for prepending to PATH.  It sleeps to mimic start-up, prints progress lines
+and writes an output file of the requested size.  With ``--flat-playlist``
+it lists ``BENCH_PLAYLIST_SIZE`` entries in pages of 100.
+"""
+import json
+import os
+import re
+import stat
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, urlunsplit, parse_qs
+
+from requests.adapters import HTTPAdapter
+
+MEDIA_HOST = "cdn.bench"
+RANGE_RE = re.compile(r'bytes=(\d+)-(\d*)')
+PAGE_HOSTS = {
+    "www.instagram.com": "instagram",
+    "www.facebook.com": "facebook",
+    "x.com": "twitter",
+    "twitter.com": "twitter",
+    "www.reddit.com": "reddit",
+}
+
+
+def media_url(size: int, kind: str = "mp4") -> str:
+    """Return the (fake) public URL of a synthetic media file of ``size`` bytes."""
+    return f"https://{MEDIA_HOST}/media/{size}.{kind}"
+
+
+def post_page(platform: str, post_id: str, media_size: int, padding: int) -> bytes:
+    """Build a post page whose head advertises a video and whose body is mostly script."""
+    head = (
+        f'<!DOCTYPE html><html><head><title>{platform} post</title>'
+        f'<meta property="og:title" content="Benchmark post {post_id} on Instagram">'
+        f'<meta property="og:description" content="Synthetic {platform} post used for benchmarks">'
+        f'<meta property="og:video" content="{media_url(media_size)}">'
+        f'<meta property="og:image" content="{media_url(4096, "jpg")}">'
+        f'<meta name="twitter:card" content="player"></head>'
+    )
+    body = '<body><script>var data = "' + 'x' * padding + '";</script></body></html>'
+    return (head + body).encode()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str, extra_headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (extra_headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self._write(body)
+
+    def _write(self, body: bytes):
+        rate = self.server.per_connection_rate
+        chunk = 64 * 1024
+        try:
+            for offset in range(0, len(body), chunk):
+                self.wfile.write(body[offset:offset + chunk])
+                if rate:
+                    time.sleep(chunk / rate)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def do_GET(self):
+        self.server.request_count += 1
+        parts = self.path.lstrip("/").split("/", 1)
+        host, rest = parts[0], "/" + (parts[1] if len(parts) > 1 else "")
+        path, _, query = rest.partition("?")
+
+        if host == MEDIA_HOST and path.startswith("/media/"):
+            return self._serve_media(path)
+        if host == "www.tikwm.com":
+            post_url = parse_qs(query).get("url", [""])[0]
+            payload = {"success": True, "data": {"play": media_url(self.server.media_size), "source": post_url}}
+            return self._send(200, json.dumps(payload).encode(), "application/json")
+        if host in PAGE_HOSTS:
+            post_id = path.strip("/").split("/")[-1] or "post"
+            body = post_page(PAGE_HOSTS[host], post_id, self.server.media_size, self.server.page_padding)
+            return self._send(200, body, "text/html; charset=utf-8")
+        self._send(404, b"not found", "text/plain")
+
+    def _serve_media(self, path: str):
+        size = int(os.path.splitext(os.path.basename(path))[0])
+        data = self.server.media_bytes(size)
+        content_type = "image/jpeg" if path.endswith(".jpg") else "video/mp4"
+        match = RANGE_RE.match(self.headers.get("Range", ""))
+        if not match:
+            return self._send(200, data, content_type, {"Accept-Ranges": "bytes"})
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else size - 1
+        end = min(end, size - 1)
+        self._send(206, data[start:end + 1], content_type,
+                   {"Accept-Ranges": "bytes", "Content-Range": f"bytes {start}-{end}/{size}"})
+
+
+class FakePlatformServer(ThreadingHTTPServer):
+    """Threaded local HTTP server impersonating the platforms and their CDNs."""
+
+    daemon_threads = True
+    # The default backlog of 5 drops connections from wide concurrency runs
+    request_queue_size = 1024
+
+    def __init__(self, media_size: int = 4 * 1024 * 1024, page_padding: int = 2 * 1024 * 1024,
+                 per_connection_rate: int = None):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.media_size = media_size
+        self.page_padding = page_padding
+        self.per_connection_rate = per_connection_rate
+        self.request_count = 0
+        self._media = {}
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def media_bytes(self, size: int) -> bytes:
+        with self._lock:
+            if size not in self._media:
+                block = bytes(range(256)) * 4096
+                self._media[size] = (block * (size // len(block) + 1))[:size]
+            return self._media[size]
+
+    def start(self) -> "FakePlatformServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class LocalRedirectAdapter(HTTPAdapter):
+    """Transport adapter that sends every request to a FakePlatformServer.
+
+    ``https://host/path?q`` becomes ``<base_url>/host/path?q``, so the
+    downloader's own session, parsers and transfer code run unchanged.
+    """
+
+    def __init__(self, base_url: str, **kwargs):
+        self.base_url = base_url
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        base = urlsplit(self.base_url)
+        request.url = urlunsplit((base.scheme, base.netloc, f"/{parts.netloc}{parts.path}", parts.query, ""))
+        return super().send(request, **kwargs)
+
+
+def redirect_session(session, server: FakePlatformServer, pool_maxsize: int = 16):
+    """Point an existing requests session at the fake server."""
+    adapter = LocalRedirectAdapter(server.base_url, pool_connections=4, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+def redirect_client_session(server: FakePlatformServer, limit: int = 1000):
+    """Build an aiohttp session that sends every request to the fake server."""
+    import aiohttp
+    from yarl import URL
+    base = URL(server.base_url)
+
+    class LocalRedirectRequest(aiohttp.ClientRequest):
+        def __init__(self, method, url, *args, **kwargs):
+            url = base.with_path(f"/{url.host}{url.path}").with_query(url.query)
+            super().__init__(method, url, *args, **kwargs)
+
+    return aiohttp.ClientSession(request_class=LocalRedirectRequest, connector=aiohttp.TCPConnector(limit=limit))
+
+
+STUB_YTDLP = r'''#!{python}
+"""Stub yt-dlp used by the offline benchmarks."""
+import json, os, sys, time
+
+args = sys.argv[1:]
+time.sleep(float(os.environ.get("BENCH_YTDLP_STARTUP", "0.2")))
+size = int(os.environ.get("BENCH_YTDLP_BYTES", str(1024 * 1024)))
+target = args[-1]
+if "--load-info-json" in args:
+    with open(args[args.index("--load-info-json") + 1]) as f:
+        target = json.load(f).get("webpage_url", target)
+
+if any(s and s in target for s in os.environ.get("BENCH_YTDLP_FAIL", "").split(",")):
+    print("ERROR: [stub] unsupported URL: " + target, file=sys.stderr)
+    sys.exit(1)
+
+if "--flat-playlist" in args:
+    # One JSON line per entry, with a pause per page of 100 like a real listing
+    count = int(os.environ.get("BENCH_PLAYLIST_SIZE", "50"))
+    first, last = 1, count
+    if "--playlist-items" in args:
+        start, _, end = args[args.index("--playlist-items") + 1].partition(":")
+        first, last = int(start or 1), min(count, int(end) if end else count)
+    for index in range(first, last + 1):
+        if index > first and index % 100 == 1:
+            time.sleep(float(os.environ.get("BENCH_PLAYLIST_PAGE_DELAY", "0.5")))
+        video_id = "pl%05d" % index
+        print(json.dumps({{"_type": "url", "ie_key": "Youtube", "id": video_id, "title": "Playlist entry %d" % index,
+                          "url": "https://www.youtube.com/watch?v=" + video_id,
+                          "upload_date": "2024%02d%02d" % (index // 28 % 12 + 1, index % 28 + 1)}}), flush=True)
+    sys.exit(0)
+
+if "-J" in args or "--dump-single-json" in args:
+    formats = [{{"format_id": str(h), "height": h, "ext": "mp4", "tbr": h * 2.5,
+                 "vcodec": "avc1", "acodec": "mp4a", "url": "https://cdn.bench/media/%d.mp4" % size}}
+               for h in (144, 240, 360, 480, 720, 1080)]
+    print(json.dumps({{"id": "stub", "title": "Stub video " + target.rsplit("/", 1)[-1],
+                      "webpage_url": target, "ext": "mp4", "formats": formats}}))
+    sys.exit(0)
+
+if "--get-title" in args:
+    print("Stub video " + target.rsplit("/", 1)[-1])
+    sys.exit(0)
+
+output = args[args.index("-o") + 1] if "-o" in args else "%(title)s.%(ext)s"
+if output == "-":
+    chunk = b"\0" * 65536
+    for _ in range(size // len(chunk)):
+        sys.stdout.buffer.write(chunk)
+    sys.stdout.buffer.flush()
+    sys.exit(0)
+
+path = output.replace("%(ext)s", "mp4")
+print("[generic] stub: Extracting URL", flush=True)
+print("[download] Destination: " + path, flush=True)
+with open(path, "wb") as f:
+    for step in range(1, 11):
+        f.write(b"\0" * (size // 10))
+        print("[download] %5.1f%% of %.2fMiB at 10.00MiB/s ETA 00:00" % (step * 10, size / 1048576), flush=True)
+'''
+
+
+def install_stub_ytdlp(directory: str) -> str:
+    """Write the stub ``yt-dlp`` into ``directory`` and return its path."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "yt-dlp")
+    with open(path, "w") as f:
+        f.write(STUB_YTDLP.format(python=sys.executable))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
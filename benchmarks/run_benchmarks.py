@@ -0,0 +1,393 @@
+"""Offline benchmarks for media_downloader.
+
+Run from the repository root::
+
+    python -m benchmarks.run_benchmarks                      # all benchmarks
+    python -m benchmarks.run_benchmarks --only download_file
+    python -m benchmarks.run_benchmarks --compare benchmarks/results/old.json
+
+No network access is needed: platform pages, the tikwm API and CDN media
+come from ``FakePlatformServer``, and ``yt-dlp`` is replaced on PATH by a
+stub that simulates start-up latency and progress output.  Results are
+written as JSON to ``benchmarks/results/`` (or ``--output``).
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform as platform_module
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Keep extract_metadata on the stubbed yt-dlp executable even when the real
+# yt_dlp package is installed, so no benchmark ever touches the network.
+sys.modules.setdefault("yt_dlp", None)
+
+from benchmarks.fake_services import (FakePlatformServer, install_stub_ytdlp, media_url, redirect_client_session,
+                                      redirect_session)
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    """Register a benchmark function under ``name``."""
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the downloader's prints and progress bars while timing."""
+    sink = io.StringIO()
+    with contextlib.redirect_stdout(sink), contextlib.redirect_stderr(sink):
+        yield
+
+
+def summarize(samples: list, **extra) -> dict:
+    """Reduce timing samples (seconds) to summary statistics."""
+    ordered = sorted(samples)
+    stats = {
+        "runs": len(samples),
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "mean": statistics.fmean(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))],
+        "max": ordered[-1],
+    }
+    stats.update(extra)
+    return stats
+
+
+def timed(func, repeat: int) -> list:
+    samples = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+class BenchEnvironment:
+    """Fake server, stub yt-dlp and a fresh downloader in a scratch directory."""
+
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix="media-bench-")
+        self.server = FakePlatformServer(media_size=args.media_size, page_padding=args.page_padding,
+                                         per_connection_rate=args.per_connection_rate).start()
+        install_stub_ytdlp(os.path.join(self.workdir, "bin"))
+        os.environ["PATH"] = os.path.join(self.workdir, "bin") + os.pathsep + os.environ["PATH"]
+        os.environ["BENCH_YTDLP_STARTUP"] = str(args.ytdlp_startup)
+        os.environ["BENCH_YTDLP_BYTES"] = str(args.ytdlp_bytes)
+        self._counter = 0
+
+    def downloader(self, **kwargs):
+        from media_downloader import MediaDownloader
+        self._counter += 1
+        output_dir = os.path.join(self.workdir, f"downloads-{self._counter}")
+        downloader = MediaDownloader(output_dir=output_dir, **kwargs)
+        redirect_session(downloader.session, self.server)
+        return downloader
+
+    def close(self):
+        self.server.stop()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+@benchmark("detect_platform")
+def bench_detect_platform(env, args):
+    downloader = env.downloader()
+    urls = [
+        "https://www.youtube.com/watch?v=abc", "https://youtu.be/abc", "https://www.instagram.com/p/abc/",
+        "https://www.facebook.com/watch/?v=1", "https://x.com/u/status/1", "https://www.tiktok.com/@u/video/1",
+        "https://www.reddit.com/r/videos/comments/abc/title/", "https://www.pinterest.com/pin/1/",
+    ]
+    loops = 20000
+    samples = timed(lambda i: [downloader.detect_platform(urls[n % len(urls)]) for n in range(loops)], args.repeat)
+    return summarize([s / loops for s in samples], unit="seconds per call")
+
+
+@benchmark("get_original_filename")
+def bench_get_original_filename(env, args):
+    downloader = env.downloader()
+    results = {}
+    for platform, url in [("instagram", "https://www.instagram.com/p/{i}/"),
+                          ("reddit", "https://www.reddit.com/r/videos/comments/{i}/title/"),
+                          ("youtube", "https://www.youtube.com/watch?v=bench{i}")]:
+        def run(i, platform=platform, url=url):
+            target = url.format(i=i)
+            page = downloader.fetch_page_metadata(target) if platform != "youtube" else None
+            downloader.get_original_filename(target, platform, page)
+        with quiet():
+            results[platform] = summarize(timed(run, args.repeat))
+    return results
+
+
+@benchmark("fallback_handlers")
+def bench_fallback_handlers(env, args):
+    downloader = env.downloader()
+    handlers = {
+        "instagram": (downloader.download_instagram, "https://www.instagram.com/p/{i}/"),
+        "facebook": (downloader.download_facebook, "https://www.facebook.com/user/videos/{i}/"),
+        "twitter": (downloader.download_twitter, "https://x.com/user/status/{i}"),
+        "reddit": (downloader.download_reddit, "https://www.reddit.com/r/videos/comments/{i}/title/"),
+        "tiktok": (downloader.download_tiktok, "https://www.tiktok.com/@user/video/{i}"),
+    }
+    os.makedirs(downloader.output_dir, exist_ok=True)
+    results = {}
+    for platform, (handler, url) in handlers.items():
+        def run(i, handler=handler, url=url, platform=platform):
+            output_path = os.path.join(downloader.output_dir, f"{platform}_{i}")
+            result = handler(url.format(i=i), output_path)
+            if "error" in result.lower() or "no media" in result.lower():
+                raise RuntimeError(result)
+        with quiet():
+            results[platform] = summarize(timed(run, args.repeat))
+    return results
+
+
+@benchmark("download_file")
+def bench_download_file(env, args):
+    results = {}
+    size = args.media_size
+    for label, segments in [("single_stream", 1), ("segmented", 4)]:
+        downloader = env.downloader(download_segments=segments, segment_min_size=1)
+        os.makedirs(downloader.output_dir, exist_ok=True)
+
+        def run(i, downloader=downloader):
+            downloader._download_file(media_url(size), os.path.join(downloader.output_dir, f"file_{i}.mp4"))
+        with quiet():
+            samples = timed(run, args.repeat)
+        results[label] = summarize(samples, bytes=size, mib_per_second=size / 1048576 / statistics.median(samples))
+    return results
+
+
+@benchmark("end_to_end")
+def bench_end_to_end(env, args):
+    results = {}
+    cases = {
+        "youtube_ytdlp": "https://www.youtube.com/watch?v=e2e{n}",
+        "instagram_fallback": "https://www.instagram.com/p/e2e{n}/",
+    }
+    # The stub fails Instagram so the og:-tag fallback path is exercised
+    os.environ["BENCH_YTDLP_FAIL"] = "instagram.com"
+    try:
+        for case, url in cases.items():
+            for concurrency in args.concurrency:
+                downloader = env.downloader()
+                jobs = args.repeat * concurrency
+                latencies = []
+
+                def run_one(n):
+                    started = time.perf_counter()
+                    downloader.download(url.format(n=n))
+                    latencies.append(time.perf_counter() - started)
+
+                with quiet():
+                    started = time.perf_counter()
+                    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                        list(pool.map(run_one, range(jobs)))
+                    wall = time.perf_counter() - started
+                results[f"{case}@{concurrency}"] = summarize(latencies, concurrency=concurrency,
+                                                             wall_seconds=wall, jobs_per_second=jobs / wall)
+    finally:
+        os.environ.pop("BENCH_YTDLP_FAIL", None)
+    return results
+
+
+@benchmark("playlist")
+def bench_playlist(env, args):
+    """Time to the first finished download and in total for a paginated playlist."""
+    from batch_download import BatchDownloader
+    from playlist_expansion import PlaylistExpansion
+    os.environ["BENCH_PLAYLIST_SIZE"] = str(args.playlist_size)
+    try:
+        first_results, totals = [], []
+        for i in range(args.repeat):
+            downloader = env.downloader()
+            runner = BatchDownloader(downloader, max_workers=8)
+            started = time.perf_counter()
+            first = None
+            with quiet():
+                for _ in runner.run(PlaylistExpansion(downloader, f"https://www.youtube.com/playlist?list=bench{i}")):
+                    if first is None:
+                        first = time.perf_counter() - started
+            first_results.append(first)
+            totals.append(time.perf_counter() - started)
+    finally:
+        os.environ.pop("BENCH_PLAYLIST_SIZE", None)
+    return {"first_result": summarize(first_results), "total": summarize(totals, entries=args.playlist_size)}
+
+
+@benchmark("async_fallback")
+def bench_async_fallback(env, args):
+    """Throughput of many concurrent fallback downloads: a thread each vs one event loop."""
+    import asyncio
+    from async_downloader import AsyncMediaDownloader
+    from media_downloader import MediaDownloader
+    server = FakePlatformServer(media_size=args.fallback_media_size, page_padding=64 * 1024).start()
+    url = "https://www.instagram.com/p/{engine}{concurrency}x{n}/"
+    os.environ["BENCH_YTDLP_FAIL"] = "instagram.com"
+    results = {}
+
+    def new_downloader(name):
+        output_dir = os.path.join(env.workdir, f"fallback-{name}")
+        downloader = MediaDownloader(output_dir=output_dir, show_progress=False,
+                                     pool_size=max(args.async_concurrency))
+        redirect_session(downloader.session, server, pool_maxsize=max(args.async_concurrency))
+        # Fail yt-dlp until its circuit opens, so the timed runs measure the fallback
+        with quiet():
+            for n in range(downloader.router.failure_threshold):
+                downloader.download(url.format(engine="warm", concurrency=0, n=n))
+        return downloader
+
+    async def run_async(downloader, urls):
+        engine = AsyncMediaDownloader(downloader, session_factory=lambda: redirect_client_session(server))
+        async with engine:
+            return [item async for item in engine.download_many(urls, concurrency=len(urls))]
+
+    try:
+        for concurrency in args.async_concurrency:
+            downloader = new_downloader(f"threads{concurrency}")
+            urls = [url.format(engine="t", concurrency=concurrency, n=n) for n in range(concurrency)]
+            with quiet():
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    outcomes = list(pool.map(downloader.download, urls))
+                wall = time.perf_counter() - started
+            failed = sum(not downloader._resolve_result_path(result) for result in outcomes)
+            results[f"threads@{concurrency}"] = summarize([wall], jobs_per_second=concurrency / wall, failed=failed)
+
+            downloader = new_downloader(f"asyncio{concurrency}")
+            urls = [url.format(engine="a", concurrency=concurrency, n=n) for n in range(concurrency)]
+            with quiet():
+                started = time.perf_counter()
+                items = asyncio.run(run_async(downloader, urls))
+                wall = time.perf_counter() - started
+            failed = sum(not downloader._resolve_result_path(item.get("result")) for item in items)
+            results[f"asyncio@{concurrency}"] = summarize([wall], jobs_per_second=concurrency / wall, failed=failed)
+    finally:
+        os.environ.pop("BENCH_YTDLP_FAIL", None)
+        server.stop()
+    return results
+
+
+@benchmark("startup")
+def bench_startup(env, args):
+    """Cold-start time of a fresh interpreter for the CLI and the web server."""
+    cases = {
+        "bare_interpreter": ["-c", "pass"],
+        "cli_import": ["-c", "import media_downloader"],
+        "cli_help": ["-m", "media_downloader", "--help"],
+        "server_import": ["-c", "import web_app"],
+    }
+    child_env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    results = {}
+    for name, command in cases.items():
+        def run(i, command=command):
+            subprocess.run([sys.executable] + command, cwd=env.workdir, env=child_env, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        results[name] = summarize(timed(run, args.repeat))
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(RESULTS_DIR)).stdout.strip()
+    except OSError:
+        return ""
+
+
+def _medians(results: dict, prefix: str = "") -> dict:
+    """Flatten nested results into ``{"name/sub": median}``."""
+    medians = {}
+    for key, value in results.items():
+        if isinstance(value, dict) and "median" in value:
+            medians[prefix + key] = value["median"]
+        elif isinstance(value, dict):
+            medians.update(_medians(value, f"{prefix}{key}/"))
+    return medians
+
+
+def compare(previous_path: str, current: dict, threshold: float):
+    """Print median changes against an earlier results file."""
+    with open(previous_path) as f:
+        previous = _medians(json.load(f)["results"])
+    regressions = 0
+    for name, median in sorted(_medians(current["results"]).items()):
+        if name not in previous:
+            continue
+        ratio = median / previous[name] if previous[name] else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{name:45s} {previous[name]:.6f}s -> {median:.6f}s  x{ratio:.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline media_downloader benchmarks")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="Benchmarks to run")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16],
+                        help="Concurrency levels for the end-to-end benchmark")
+    parser.add_argument("--media-size", type=int, default=16 * 1024 * 1024, help="Size of served media in bytes")
+    parser.add_argument("--page-padding", type=int, default=2 * 1024 * 1024,
+                        help="Bytes of inline script after each post page's head")
+    parser.add_argument("--per-connection-rate", type=int, default=None,
+                        help="Throttle each server connection to this many bytes/s")
+    parser.add_argument("--ytdlp-startup", type=float, default=0.2, help="Stub yt-dlp start-up delay in seconds")
+    parser.add_argument("--ytdlp-bytes", type=int, default=1024 * 1024, help="Bytes the stub yt-dlp writes")
+    parser.add_argument("--playlist-size", type=int, default=100, help="Entries in the benchmark playlist")
+    parser.add_argument("--async-concurrency", type=int, nargs="+", default=[16, 256],
+                        help="Downloads in flight for the async_fallback benchmark")
+    parser.add_argument("--fallback-media-size", type=int, default=256 * 1024,
+                        help="Size of the media served in the async_fallback benchmark")
+    parser.add_argument("--output", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Slowdown ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    env = BenchEnvironment(args)
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_revision": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform_module.platform(),
+            "settings": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "only")},
+        },
+        "results": {},
+    }
+    try:
+        for name in args.only or BENCHMARKS:
+            print(f"Running {name}...", flush=True)
+            report["results"][name] = BENCHMARKS[name](env, args)
+    finally:
+        env.close()
+
+    output = args.output or os.path.join(RESULTS_DIR, f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        return 1 if compare(args.compare, report, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+
+from media_metadata import normalize_url
+
+# Patterns that pull a stable post/video ID out of a normalized URL path
+POST_ID_PATTERNS = {
+    "instagram": re.compile(r'/(?:p|reel|reels|tv)/([^/]+)'),
+    "twitter": re.compile(r'/status(?:es)?/(\d+)'),
+    "reddit": re.compile(r'/comments/([^/]+)'),
+    "tiktok": re.compile(r'/video/(\d+)'),
+    "facebook": re.compile(r'/(?:videos|reel|posts)/(?:[^/]+/)?(\d+)'),
+    "pinterest": re.compile(r'/pin/(\d+)'),
+}
+
+
+def media_key(url: str, platform: str) -> str:
+    """Return the canonical identity of a media item.
+
+    Uses the platform's post or video ID where one can be found in the URL, so
+    share links, mobile links and Shorts URLs of the same item map to one key.
+    Falls back to the normalized URL otherwise.
+    """
+    canonical = normalize_url(url)
+    parsed = urlparse(canonical)
+    if platform == "youtube":
+        video_id = parse_qs(parsed.query).get('v', [None])[0]
+        if video_id:
+            return f"youtube:{video_id}"
+    elif platform == "facebook" and parse_qs(parsed.query).get('v'):
+        return f"facebook:{parse_qs(parsed.query)['v'][0]}"
+    pattern = POST_ID_PATTERNS.get(platform)
+    if pattern:
+        match = pattern.search(parsed.path)
+        if match:
+            return f"{platform}:{match.group(1)}"
+    return canonical
+
+
+def file_checksum(path: str) -> str:
+    """Return the SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DownloadIndex:
+    """SQLite index of finished downloads, stored in the output directory.
+
+    Entries are keyed by ``(media_key, quality)``.  ``lookup`` only returns
+    an entry whose file still exists with the recorded size; stale entries are
+    dropped.  Paths are stored absolute, so entries stay valid whatever
+    directory the process starts in.  When ``max_bytes`` is set, ``record``
+    evicts the least recently used other files until the indexed total fits
+    the budget; a file larger than the whole budget is not indexed at all.
+    """
+
+    def __init__(self, path: str, max_bytes: Optional[int] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS downloads (
+                    media_key TEXT NOT NULL,
+                    quality TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    checksum TEXT,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (media_key, quality)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS downloads_last_access ON downloads (last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def lookup(self, key: str, quality: str) -> Optional[dict]:
+        """Return the indexed entry for a media item if its file is still intact."""
+        with self._lock, closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT * FROM downloads WHERE media_key = ? AND quality = ?",
+                               (key, quality)).fetchone()
+            if row is None:
+                return None
+            if not os.path.isfile(row['path']) or os.path.getsize(row['path']) != row['size']:
+                print(f"Indexed file missing or changed, dropping entry: {row['path']}")
+                conn.execute("DELETE FROM downloads WHERE media_key = ? AND quality = ?", (key, quality))
+                return None
+            conn.execute("UPDATE downloads SET last_access = ? WHERE media_key = ? AND quality = ?",
+                         (time.time(), key, quality))
+            return dict(row)
+
+    def record(self, key: str, quality: str, url: str, path: str):
+        """Add or replace the entry for a freshly downloaded file."""
+        path = os.path.abspath(path)
+        size = os.path.getsize(path)
+        if self.max_bytes and size > self.max_bytes:
+            print(f"Not indexing {path}: {size} bytes exceeds the {self.max_bytes} byte disk budget")
+            return
+        checksum = file_checksum(path)
+        now = time.time()
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (key, quality, url, path, size, checksum, now, now))
+            self._enforce_budget(conn, keep=(key, quality))
+
+    def _enforce_budget(self, conn: sqlite3.Connection, keep: tuple):
+        """Delete least recently used files, other than ``keep``'s, until the total fits ``max_bytes``."""
+        if not self.max_bytes:
+            return
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM downloads").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for row in conn.execute("SELECT media_key, quality, path, size FROM downloads "
+                                "ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            if (row['media_key'], row['quality']) == keep:
+                continue
+            try:
+                os.remove(row['path'])
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Could not evict {row['path']}: {e}")
+                continue
+            conn.execute("DELETE FROM downloads WHERE media_key = ? AND quality = ?",
+                         (row['media_key'], row['quality']))
+            total -= row['size']
+            print(f"Evicted {row['path']} to stay within the disk budget")
+
+    def prune_missing(self) -> int:
+        """Drop entries whose files no longer exist; return how many were removed."""
+        with self._lock, closing(self._connect()) as conn, conn:
+            rows = conn.execute("SELECT media_key, quality, path FROM downloads").fetchall()
+            missing = [(row['media_key'], row['quality']) for row in rows if not os.path.isfile(row['path'])]
+            conn.executemany("DELETE FROM downloads WHERE media_key = ? AND quality = ?", missing)
+        return len(missing)
@@ -0,0 +1,162 @@
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no room for another download."""
+
+
+class DownloadJob:
+    """A single queued download and its outcome."""
+
+    def __init__(self, url: str, selected_quality: str = "7"):
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.selected_quality = selected_quality
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = None
+        self.version = 0
+        self.done = threading.Event()
+        self._changed = threading.Condition()
+
+    def update_progress(self, event: dict):
+        """Record the latest progress event and wake any listeners."""
+        with self._changed:
+            self.progress = dict(self.progress or {}, **event)
+            self.version += 1
+            self._changed.notify_all()
+
+    def mark_changed(self):
+        """Wake listeners after a status change."""
+        with self._changed:
+            self.version += 1
+            self._changed.notify_all()
+
+    def wait_for_change(self, version: int, timeout: float = 15) -> int:
+        """Block until the job changes past ``version`` or the timeout passes."""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def to_dict(self) -> dict:
+        """Return a JSON-serialisable view of the job."""
+        return {
+            "id": self.id,
+            "url": self.url,
+            "selected_quality": self.selected_quality,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": self.progress,
+        }
+
+
+class DownloadJobQueue:
+    """Bounded queue feeding a fixed pool of download worker threads.
+
+    Each worker runs ``downloader.download`` for one job at a time, so the
+    number of concurrent yt-dlp processes never exceeds ``workers``.  When
+    ``max_queued`` jobs are already waiting, ``submit`` raises
+    ``QueueFullError`` instead of accepting more work.
+    """
+
+    def __init__(self, downloader, workers: int = 4, max_queued: int = 32, max_history: int = 500):
+        self.downloader = downloader
+        self.workers = max(1, workers)
+        self.max_history = max_history
+        self._queue = queue.Queue(maxsize=max(1, max_queued))
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _start_workers(self):
+        """Start the worker threads on first use."""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"download-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, url: str, selected_quality: str = "7") -> DownloadJob:
+        """Queue a download and return its job without waiting for it."""
+        self._start_workers()
+        job = DownloadJob(url, selected_quality)
+        with self._lock:
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise QueueFullError(f"Download queue is full ({self._queue.maxsize} jobs waiting)")
+            self._jobs[job.id] = job
+            self._prune()
+        return job
+
+    def get(self, job_id: str) -> Optional[DownloadJob]:
+        """Look up a job by ID."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> dict:
+        """Return queue depth and job counts by status."""
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize(),
+            "max_queued": self._queue.maxsize,
+            "jobs": counts,
+        }
+
+    def _prune(self):
+        """Forget the oldest finished jobs once history exceeds its limit."""
+        excess = len(self._jobs) - self.max_history
+        if excess <= 0:
+            return
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id].done.is_set():
+                del self._jobs[job_id]
+                excess -= 1
+
+    def _worker(self):
+        """Take jobs off the queue and run them until the process exits."""
+        while True:
+            job = self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            job.mark_changed()
+            try:
+                result = self.downloader.download(job.url, job.selected_quality, progress=job.update_progress)
+                # Failures also come back as result strings; only a file on disk counts as done
+                if self.downloader._resolve_result_path(result):
+                    job.result = result
+                    job.status = "finished"
+                else:
+                    print(f"Job {job.id} failed: {result}")
+                    job.error = result
+                    job.status = "failed"
+            except Exception as e:
+                print(f"Job {job.id} failed: {e}")
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                job.finished_at = time.time()
+                job.done.set()
+                job.mark_changed()
+                self._queue.task_done()
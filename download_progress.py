@@ -0,0 +1,62 @@
+import re
+from typing import Optional
+
+UNIT_FACTORS = {
+    "B": 1, "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3, "TiB": 1024 ** 4,
+    "KB": 1000, "MB": 1000 ** 2, "GB": 1000 ** 3, "TB": 1000 ** 4,
+}
+
+PROGRESS_RE = re.compile(
+    r'^\[download\]\s+(?P<percent>[\d.]+)%\s+of\s+~?\s*(?P<total>[\d.]+)(?P<total_unit>[KMGT]?i?B)'
+    r'(?:\s+in\s+(?P<elapsed>[\d:]+))?'
+    r'(?:\s+at\s+(?:(?P<speed>[\d.]+)(?P<speed_unit>[KMGT]?i?B)/s|Unknown B/s))?'
+    r'(?:\s+ETA\s+(?P<eta>[\d:]+|Unknown))?'
+)
+STAGE_PATTERNS = [
+    (re.compile(r'^\[download\] Destination:'), "downloading"),
+    (re.compile(r'^\[download\] .* has already been downloaded'), "finished"),
+    (re.compile(r'^\[(?:Merger|FixupM3u8|FixupM4a|VideoConvertor)\]'), "merging"),
+    (re.compile(r'^\[(?:Metadata|EmbedThumbnail)\]'), "postprocessing"),
+    (re.compile(r'^\[[\w:]+\] [^:]+: (?:Downloading|Extracting)'), "extracting"),
+]
+
+
+def _to_bytes(value: Optional[str], unit: Optional[str]) -> Optional[int]:
+    if value is None or unit is None:
+        return None
+    return int(float(value) * UNIT_FACTORS.get(unit, 1))
+
+
+def _to_seconds(value: Optional[str]) -> Optional[int]:
+    if not value or value == "Unknown":
+        return None
+    seconds = 0
+    for part in value.split(":"):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+
+def parse_ytdlp_line(line: str) -> Optional[dict]:
+    """Turn one line of yt-dlp output into a progress event, if it is one.
+
+    Download lines (``[download]  42.0% of 10.00MiB at 1.20MiB/s ETA 00:05``)
+    become events with byte counts, speed and ETA; other recognised lines
+    only report a change of stage.
+    """
+    line = line.strip()
+    match = PROGRESS_RE.match(line)
+    if match:
+        total = _to_bytes(match.group("total"), match.group("total_unit"))
+        percent = float(match.group("percent"))
+        return {
+            "stage": "downloading",
+            "percent": percent,
+            "downloaded_bytes": int(total * percent / 100) if total is not None else None,
+            "total_bytes": total,
+            "speed": _to_bytes(match.group("speed"), match.group("speed_unit")),
+            "eta": _to_seconds(match.group("eta")),
+        }
+    for pattern, stage in STAGE_PATTERNS:
+        if pattern.match(line):
+            return {"stage": stage}
+    return None
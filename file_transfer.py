@@ -0,0 +1,262 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Callable, Optional
+
+from tqdm import tqdm
+from urllib3.exceptions import HTTPError
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+_buffers = threading.local()
+
+
+def reusable_buffer(size: int) -> memoryview:
+    """Return this thread's scratch buffer of ``size`` bytes, allocating it only once."""
+    buffer = getattr(_buffers, 'buffer', None)
+    if buffer is None or len(buffer) != size:
+        buffer = _buffers.buffer = memoryview(bytearray(size))
+    return buffer
+
+
+def preallocate(file, size: int):
+    """Reserve ``size`` bytes on disk for a file up front, where the OS supports it.
+
+    Avoids fragmentation on large files and makes a full disk fail before
+    any bytes are downloaded.
+    """
+    try:
+        os.posix_fallocate(file.fileno(), 0, size)
+    except (AttributeError, OSError):
+        pass
+
+
+def copy_response(response, file, buffer_size: int = DEFAULT_BUFFER_SIZE,
+                  on_write: Optional[Callable[[int], None]] = None) -> int:
+    """Copy a streamed response body into ``file`` and return the bytes written.
+
+    The body is read straight into the thread's reusable buffer and flushed
+    to the file only when the buffer is full, so a multi-GB file takes a few
+    thousand writes instead of hundreds of thousands.  ``on_write`` is called
+    with the size of every flush.
+    """
+    raw = response.raw
+    raw.decode_content = True
+    view = reusable_buffer(buffer_size)
+    written = 0
+    filled = 0
+    while True:
+        try:
+            count = raw.readinto(view[filled:])
+        except HTTPError as e:
+            raise IOError(f"Connection broken after {written + filled} bytes: {e}") from e
+        filled += count
+        if filled and (not count or filled == len(view)):
+            file.write(view[:filled])
+            written += filled
+            if on_write:
+                on_write(filled)
+            filled = 0
+        if not count:
+            return written
+
+
+def _transfer(scheduler, url: str, priority: Optional[str] = None):
+    """Connection slot from ``scheduler``, or a no-op when there is none."""
+    return scheduler.transfer(url, priority) if scheduler else nullcontext()
+
+
+def _counter(on_write: Callable[[int], None], transfer) -> Callable[[int], None]:
+    """Combine a progress callback with the scheduler's bandwidth accounting."""
+    if transfer is None:
+        return on_write
+
+    def count(amount: int):
+        on_write(amount)
+        transfer.consume(amount)
+    return count
+
+
+def _write_body(response, output_path: str, transfer, buffer_size: int, show_progress: bool,
+                progress_interval: float) -> int:
+    """Copy an open response into ``<output>.part`` and rename it into place once complete."""
+    part_path = f"{output_path}.part"
+    completed = False
+    try:
+        total_size = int(response.headers.get('content-length', 0)) or None
+        # Content-Length counts encoded bytes when the body is compressed
+        encoded = response.headers.get('content-encoding', 'identity') != 'identity'
+        with open(part_path, 'wb') as file, \
+                tqdm(total=total_size, unit='B', unit_scale=True, desc=output_path, ascii=True,
+                     mininterval=progress_interval, disable=not show_progress) as pbar:
+            if total_size and not encoded:
+                preallocate(file, total_size)
+            written = copy_response(response, file, buffer_size, _counter(pbar.update, transfer))
+            file.truncate(written)
+        if total_size and not encoded and written != total_size:
+            raise IOError(f"Download ended early: got {written} of {total_size} bytes")
+        os.replace(part_path, output_path)
+        completed = True
+        return written
+    finally:
+        if not completed and os.path.exists(part_path):
+            os.remove(part_path)
+
+
+def _segmentable_size(response, min_size: int) -> Optional[int]:
+    """Return the body size if the file is worth fetching in Range segments, else None."""
+    if response.headers.get('accept-ranges', '').lower() != 'bytes':
+        return None
+    if response.headers.get('content-encoding', 'identity') != 'identity':
+        return None
+    size = int(response.headers.get('content-length', 0))
+    return size if size >= min_size else None
+
+
+def stream_download(session, url: str, output_path: str, headers: Optional[dict] = None,
+                    buffer_size: int = DEFAULT_BUFFER_SIZE, show_progress: bool = True,
+                    progress_interval: float = 0.5, scheduler=None, segments: int = 1,
+                    segment_min_size: Optional[int] = None, priority: Optional[str] = None) -> int:
+    """Download a URL and return its size.
+
+    Bytes go to a preallocated ``<output>.part`` that is renamed into place
+    only once the body is complete, so an interrupted download never leaves
+    a truncated file under the final name.  The progress bar redraws at most
+    once per ``progress_interval`` seconds.  With a ``TransferScheduler`` the
+    transfer waits for a connection slot and is held to its bandwidth caps.
+
+    With ``segments > 1``, a response that advertises byte ranges and is at
+    least ``segment_min_size`` bytes is dropped after its headers and the
+    file is fetched as a ``SegmentedDownload`` instead.  Everything smaller
+    is streamed from the first response, so it costs a single request.
+    """
+    with _transfer(scheduler, url, priority) as transfer, \
+            session.get(url, headers=headers, stream=True) as response:
+        response.raise_for_status()
+        total_size = _segmentable_size(response, segment_min_size or 0) if segments > 1 else None
+        if not total_size:
+            return _write_body(response, output_path, transfer, buffer_size, show_progress, progress_interval)
+    # Outside the block, so this response's connection slot is free for the segments
+    SegmentedDownload(session, url, output_path, total_size, segments=segments, headers=headers,
+                      buffer_size=buffer_size, show_progress=show_progress,
+                      progress_interval=progress_interval, scheduler=scheduler, priority=priority).run()
+    return total_size
+
+
+class SegmentedDownload:
+    """Download one file over several concurrent Range requests.
+
+    Each segment is written in place into a preallocated ``<output>.part``
+    file.  Progress per segment is recorded in a ``<output>.part.json``
+    sidecar, so an interrupted download picks up only the missing byte ranges
+    on the next attempt.  The finished file is moved into place atomically.
+    """
+
+    checkpoint_interval = 2.0
+
+    def __init__(self, session, url: str, output_path: str, total_size: int, segments: int = 4,
+                 headers: Optional[dict] = None, buffer_size: int = DEFAULT_BUFFER_SIZE,
+                 show_progress: bool = True, progress_interval: float = 0.5, scheduler=None,
+                 priority: Optional[str] = None):
+        self.session = session
+        self.scheduler = scheduler
+        self.priority = priority
+        self.buffer_size = buffer_size
+        self.show_progress = show_progress
+        self.progress_interval = progress_interval
+        self.url = url
+        self.output_path = output_path
+        self.total_size = total_size
+        self.segments = max(1, segments)
+        self.headers = headers or {}
+        self.part_path = f"{output_path}.part"
+        self.state_path = f"{output_path}.part.json"
+        self._lock = threading.Lock()
+        self._last_checkpoint = 0.0
+        self.ranges = None
+
+    def _plan_ranges(self) -> list:
+        """Split the file into ``[start, end, done]`` ranges (end inclusive)."""
+        step = -(-self.total_size // self.segments)
+        return [[start, min(start + step, self.total_size) - 1, 0]
+                for start in range(0, self.total_size, step)]
+
+    def _load_state(self) -> bool:
+        """Restore segment progress from the sidecar if it was written for this URL and size."""
+        if not (os.path.exists(self.state_path) and os.path.exists(self.part_path)):
+            return False
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if state.get('url') != self.url or state.get('size') != self.total_size:
+            return False
+        if os.path.getsize(self.part_path) != self.total_size:
+            return False
+        self.ranges = state['ranges']
+        return True
+
+    def _save_state(self, force: bool = False):
+        """Write segment progress to the sidecar, at most once per interval."""
+        now = time.monotonic()
+        if not force and now - self._last_checkpoint < self.checkpoint_interval:
+            return
+        self._last_checkpoint = now
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'url': self.url, 'size': self.total_size, 'ranges': self.ranges}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _fetch_range(self, segment: list, pbar):
+        """Download the missing tail of one segment into the part file."""
+        start, end, done = segment
+        if start + done > end:
+            return
+        headers = dict(self.headers)
+        headers['Range'] = f"bytes={start + done}-{end}"
+        with _transfer(self.scheduler, self.url, self.priority) as transfer, \
+                self.session.get(self.url, headers=headers, stream=True) as response:
+            if response.status_code != 206:
+                raise IOError(f"Server ignored range request (HTTP {response.status_code})")
+            with open(self.part_path, 'r+b') as file:
+                file.seek(start + done)
+
+                def advance(count: int):
+                    with self._lock:
+                        segment[2] += count
+                        pbar.update(count)
+                        self._save_state()
+
+                copy_response(response, file, self.buffer_size, _counter(advance, transfer))
+        if start + segment[2] <= end:
+            raise IOError(f"Segment {start}-{end} ended early at byte {start + segment[2]}")
+
+    def run(self):
+        """Fetch every missing range and move the completed file into place."""
+        if self._load_state():
+            print(f"Resuming {self.output_path} from {self.state_path}")
+        else:
+            self.ranges = self._plan_ranges()
+            with open(self.part_path, 'wb') as file:
+                preallocate(file, self.total_size)
+                file.truncate(self.total_size)
+            self._save_state(force=True)
+
+        already = sum(done for _, _, done in self.ranges)
+        with tqdm(total=self.total_size, initial=already, unit='B', unit_scale=True, desc=self.output_path,
+                  ascii=True, mininterval=self.progress_interval, disable=not self.show_progress) as pbar:
+            try:
+                with ThreadPoolExecutor(max_workers=len(self.ranges)) as pool:
+                    futures = [pool.submit(self._fetch_range, segment, pbar) for segment in self.ranges]
+                    for future in futures:
+                        future.result()
+            finally:
+                with self._lock:
+                    self._save_state(force=True)
+
+        os.replace(self.part_path, self.output_path)
+        os.remove(self.state_path)
@@ -0,0 +1,44 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class PooledSession(requests.Session):
+    """requests.Session that applies a default timeout to every request."""
+
+    def __init__(self, timeout=(10, 60)):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def build_session(pool_connections: int = 16, pool_maxsize: int = 16, retries: int = 3,
+                  backoff_factor: float = 0.5, timeout=(10, 60)) -> PooledSession:
+    """Create a keep-alive session with connection pooling and retries.
+
+    ``pool_connections`` is the number of hosts whose pools are kept open and
+    ``pool_maxsize`` the number of connections kept per host; it should be at
+    least the number of worker threads sharing the session.  Only idempotent
+    requests are retried, with exponential backoff, on connection errors and
+    on 429/5xx responses.  A single session is safe to share between threads:
+    urllib3 pools are thread-safe and the cookie jar locks internally.
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+    session = PooledSession(timeout=timeout)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
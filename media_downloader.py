@@ -1,33 +1,100 @@
 import os
 import re
-import requests
+import sys
+import argparse
+import glob
+import json
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, nullcontext
 from urllib.parse import urlparse, parse_qs
-from tqdm import tqdm
-from typing import Optional
+from typing import Callable, Optional
 import subprocess
-from flask import Flask, render_template, request, redirect, url_for
 
-app = Flask(__name__)
+from download_index import DownloadIndex, media_key
+from download_progress import parse_ytdlp_line
+from media_formats import select_format
+from media_metadata import MetadataCache, extract_metadata
+from method_router import MethodRouter
+from metrics import BYTES_TOTAL, COALESCED_TOTAL, FALLBACKS_TOTAL, DownloadTrace, JsonlTraceWriter, annotate, stage
+from media_stream import MediaStream, iter_http, iter_process, prime, tee_to_file
+from og_meta import PageMetadata, fetch_page_metadata
+from playlist_expansion import PlaylistExpansion, parse_date
+from single_flight import FileLock, SingleFlight
+from transfer_scheduler import TransferScheduler, current_priority, priority_class
+
+# requests, urllib3 and tqdm (via http_session and file_transfer) are
+# imported on first use, keeping ``import media_downloader`` cheap
+MEDIA_EXTENSIONS = {"video": "mp4", "image": "jpg"}
+# Ways to fetch a URL, in the order tried when nothing is known about them
+DOWNLOAD_METHODS = ["ytdlp", "fallback"]
+# Platforms whose fallback downloads the media a post page's og: tags advertise:
+# label used in results, and the result when the page advertises nothing
+PAGE_MEDIA_PLATFORMS = {
+    "instagram": ("Instagram", "No media found in Instagram post"),
+    "facebook": ("Facebook", "No media found in Facebook post"),
+    "twitter": ("Twitter/X", "No media found in Twitter/X post"),
+    "reddit": ("Reddit", "No media found in Reddit post. Try using youtube-dl with --verbose flag to debug."),
+}
+
+
 
 # Initialize the MediaDownloader
 class MediaDownloader:
     """Multi-platform media downloader for social media content without ffmpeg dependency."""
 
     QUALITY_OPTIONS = {
-        "1": {"resolution": "144p", "format_id": "best[height<=144]/worst"},
-        "2": {"resolution": "240p", "format_id": "best[height<=240]/worst"},
-        "3": {"resolution": "360p", "format_id": "best[height<=360]/worst"},
-        "4": {"resolution": "480p", "format_id": "best[height<=480]/worst"},
-        "5": {"resolution": "720p", "format_id": "best[height<=720]/worst"},
-        "6": {"resolution": "1080p", "format_id": "best[height<=1080]/worst"},
-        "7": {"resolution": "Best available", "format_id": "best"}
+        "1": {"resolution": "144p", "height": 144, "format_id": "best[height<=144]/worst"},
+        "2": {"resolution": "240p", "height": 240, "format_id": "best[height<=240]/worst"},
+        "3": {"resolution": "360p", "height": 360, "format_id": "best[height<=360]/worst"},
+        "4": {"resolution": "480p", "height": 480, "format_id": "best[height<=480]/worst"},
+        "5": {"resolution": "720p", "height": 720, "format_id": "best[height<=720]/worst"},
+        "6": {"resolution": "1080p", "height": 1080, "format_id": "best[height<=1080]/worst"},
+        "7": {"resolution": "Best available", "height": None, "format_id": "best"}
     }
 
-    def __init__(self, output_dir: str = "downloads"):
+    def __init__(self, output_dir: str = "downloads", pool_size: int = 16, download_segments: int = 4,
+                 segment_min_size: int = 8 * 1024 * 1024, index_max_bytes: Optional[int] = None,
+                 trace_hook: Optional[Callable[[dict], None]] = None, buffer_size: int = 1024 * 1024,
+                 show_progress: Optional[bool] = None, scheduler: Optional[TransferScheduler] = None):
         """Initialize the downloader with configuration."""
         self.output_dir = output_dir
         self.create_output_dir()
         self.selected_quality = "7"  # Default to best quality
+        self.pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+        self.metadata_cache = MetadataCache()
+        self.download_segments = download_segments
+        self.segment_min_size = segment_min_size
+        # Reused read/write buffer per thread for direct file downloads
+        self.buffer_size = buffer_size
+        # Progress bars only make sense on a terminal, not in server logs
+        self.show_progress = sys.stderr.isatty() if show_progress is None else show_progress
+        # Finished downloads, so repeated URLs are served from disk
+        self.index = DownloadIndex(os.path.join(output_dir, "download_index.sqlite3"), max_bytes=index_max_bytes)
+        # Bandwidth caps, per-host connection limits and priority classes
+        self.scheduler = scheduler or TransferScheduler()
+        # In-flight downloads by item and quality, shared with identical requests
+        self.flights = SingleFlight()
+        # Lock files that extend the sharing to other worker processes
+        self.lock_dir = os.path.join(output_dir, ".locks")
+        self.lock_timeout = 1800
+        # Recent success/latency per (platform, method), with circuit breakers
+        self.router = MethodRouter()
+        # Called with every finished download trace, e.g. a JsonlTraceWriter
+        self.trace_hook = trace_hook
+
+    @property
+    def session(self):
+        """One keep-alive session shared by every fetch and worker thread, built on first use."""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    from http_session import build_session
+                    self._session = build_session(pool_maxsize=self.pool_size)
+        return self._session
 
     def create_output_dir(self):
         """Create output directory if it doesn't exist."""
@@ -56,61 +123,101 @@ class MediaDownloader:
         else:
             raise ValueError(f"Unsupported platform: {domain}")
 
-    def get_original_filename(self, url: str, platform: str, response_content: str = None) -> str:
+    def get_metadata(self, url: str) -> Optional[dict]:
+        """Return yt-dlp metadata for a URL, extracting it at most once per cache lifetime."""
+        info = self.metadata_cache.get(url)
+        if info is not None:
+            return info
+        try:
+            with stage("metadata", method="ytdlp"):
+                info = extract_metadata(url)
+        except Exception as e:
+            print(f"Metadata extraction failed: {e}")
+            return None
+        self.metadata_cache.put(url, info)
+        return info
+
+    def resolve_format(self, url: str, selected_quality: str, allow_merge: bool = True) -> tuple:
+        """Return ``(info, selection)`` for the format matching a quality option.
+
+        The format table comes from the cached metadata, so it is listed once
+        per URL; ``selection`` is None when the table offers nothing to choose.
+        """
+        info = self.get_metadata(url)
+        if not info:
+            return None, None
+        max_height = self.QUALITY_OPTIONS.get(selected_quality, self.QUALITY_OPTIONS["7"])["height"]
+        return info, select_format(info.get("formats") or [], max_height, allow_merge)
+
+    def available_qualities(self, url: str) -> list:
+        """Return the quality options that deliver a distinct resolution for a URL.
+
+        An option is listed only if it delivers a format no taller than its
+        nominal height and different from the option below it; "Best
+        available" is always listed.
+        """
+        info = self.get_metadata(url)
+        if not info:
+            raise ValueError("Could not list formats for this URL")
+        formats = info.get("formats") or []
+        qualities = []
+        delivered = None
+        for value, option in self.QUALITY_OPTIONS.items():
+            selection = select_format(formats, option["height"])
+            current = (selection["height"], selection["label"]) if selection else None
+            fits = selection is not None and (selection["height"] or 0) <= (option["height"] or 0)
+            if option["height"] is None or (fits and current != delivered):
+                qualities.append({"value": value, "resolution": option["resolution"],
+                                  "delivers": selection["label"] if selection else None})
+            if fits:
+                delivered = current
+        return qualities
+
+    def fetch_page_metadata(self, url: str) -> PageMetadata:
+        """Fetch only the head of a post page and collect its og:/twitter: tags."""
+        return fetch_page_metadata(self.session, url)
+
+    def get_original_filename(self, url: str, platform: str, page: Optional[PageMetadata] = None) -> str:
         """Extract original filename from URL or metadata."""
         original_name = None
 
         try:
             if platform == "youtube":
-                # Get original YouTube video title using yt-dlp
-                try:
-                    command = [
-                        'yt-dlp',
-                        '--get-title',
-                        '--no-playlist',
-                        url
-                    ]
-                    result = subprocess.run(command, capture_output=True, text=True)
-                    if result.returncode == 0 and result.stdout.strip():
-                        original_name = result.stdout.strip()
+                # Get original YouTube video title from the shared metadata pass
+                info = self.get_metadata(url)
+                if info and info.get('title'):
+                    original_name = re.sub(r'[\\/*?:"<>|]', "", info['title'])
+                    print(f"Extracted YouTube title: {original_name}")
+                else:
+                    # Fall back to YouTube API if installed
+                    try:
+                        from pytube import YouTube
+                        yt = YouTube(url)
+                        original_name = yt.title
                         original_name = re.sub(r'[\\/*?:"<>|]', "", original_name)
-                        print(f"Extracted YouTube title: {original_name}")
-                    else:
-                        print(f"yt-dlp title extraction failed: {result.stderr}")
-                        # Fall back to YouTube API if installed
-                        try:
-                            from pytube import YouTube
-                            yt = YouTube(url)
-                            original_name = yt.title
-                            original_name = re.sub(r'[\\/*?:"<>|]', "", original_name)
-                            print(f"Extracted YouTube title using pytube: {original_name}")
-                        except Exception as e:
-                            print(f"pytube title extraction failed: {e}")
-                except Exception as e:
-                    print(f"Command-line title extraction failed: {e}")
+                        print(f"Extracted YouTube title using pytube: {original_name}")
+                    except Exception as e:
+                        print(f"pytube title extraction failed: {e}")
 
             elif platform == "instagram":
-                if response_content:
-                    title_match = re.search(r'<meta property="og:title" content="([^"]+)"', response_content)
-                    if title_match:
-                        original_name = title_match.group(1).split(" on Instagram")[0].strip()
-                        original_name = f"instagram_{original_name}"
+                title = page.first('og:title') if page else None
+                if title:
+                    original_name = title.split(" on Instagram")[0].strip()
+                    original_name = f"instagram_{original_name}"
 
             elif platform == "twitter":
-                if response_content:
-                    title_match = re.search(r'<meta property="og:description" content="([^"]+)"', response_content)
-                    if title_match:
-                        words = title_match.group(1).split()[:5]
-                        original_name = f"twitter_{'_'.join(words)}"
-                        original_name = re.sub(r'[\\/*?:"<>|]', "", original_name)
+                description = page.first('og:description') if page else None
+                if description:
+                    words = description.split()[:5]
+                    original_name = f"twitter_{'_'.join(words)}"
+                    original_name = re.sub(r'[\\/*?:"<>|]', "", original_name)
 
             elif platform == "reddit":
-                if response_content:
-                    title_match = re.search(r'<meta property="og:title" content="([^"]+)"', response_content)
-                    if title_match:
-                        words = title_match.group(1).split()[:5]
-                        original_name = f"reddit_{'_'.join(words)}"
-                        original_name = re.sub(r'[\\/*?:"<>|]', "", original_name)
+                title = page.first('og:title') if page else None
+                if title:
+                    words = title.split()[:5]
+                    original_name = f"reddit_{'_'.join(words)}"
+                    original_name = re.sub(r'[\\/*?:"<>|]', "", original_name)
                 else:
                     parsed_url = urlparse(url)
                     path_parts = parsed_url.path.strip("/").split("/")
@@ -150,170 +257,362 @@ class MediaDownloader:
 
         return original_name
 
-    def download(self, url: str, selected_quality: str = "7", output_name: Optional[str] = None) -> str:
-        """Main download method that routes to appropriate platform handler."""
-        self.selected_quality = selected_quality
-        platform = self.detect_platform(url)
-        print(f"Detected platform: {platform}")
-
+    def _convert_shorts_url(self, url: str, platform: str) -> str:
+        """Rewrite YouTube Shorts links to the standard watch URL."""
         if platform == "youtube" and "/shorts/" in url:
             print("Detected YouTube Shorts video")
             video_id = url.split("/shorts/")[1].split("?")[0]
             url = f"https://www.youtube.com/watch?v={video_id}"
             print(f"Converted to standard YouTube URL: {url}")
+        return url
+
+    def download(self, url: str, selected_quality: str = "7", output_name: Optional[str] = None,
+                 progress: Optional[Callable[[dict], None]] = None, priority: str = "interactive") -> str:
+        """Main download method that routes to appropriate platform handler.
+
+        ``progress``, if given, is called with progress event dicts while
+        yt-dlp runs.  ``priority`` is the scheduler class: "interactive" for
+        requests someone is waiting on, "bulk" for batches.
+        """
+        with priority_class(priority), DownloadTrace(url, hook=self.trace_hook) as trace:
+            result = self._download(url, selected_quality, output_name, progress)
+            self._finish_trace(trace, result)
+        return result
+
+    def _finish_trace(self, trace: DownloadTrace, result: str):
+        """Set a download's outcome from its result and count the bytes it fetched."""
+        path = self._resolve_result_path(result)
+        trace.outcome = "success" if path else "error"
+        if path and trace.method not in ("index", "coalesced"):
+            BYTES_TOTAL.inc(os.path.getsize(path), platform=trace.platform, method=trace.method)
+
+    def _identify(self, url: str) -> tuple:
+        """Return ``(platform, url, media key)``, with Shorts links rewritten to watch URLs."""
+        with stage("detect_platform"):
+            platform = self.detect_platform(url)
+        annotate(platform=platform)
+        print(f"Detected platform: {platform}")
 
-        response_content = None
-        if platform in ["instagram", "facebook", "twitter", "reddit"] and not output_name:
+        url = self._convert_shorts_url(url, platform)
+        return platform, url, media_key(url, platform)
+
+    def _download(self, url: str, selected_quality: str, output_name: Optional[str],
+                  progress: Optional[Callable[[dict], None]]) -> str:
+        """Run the stages of a download; see ``download``."""
+        platform, url, key = self._identify(url)
+        if output_name:
+            return self._fetch(url, platform, key, selected_quality, output_name, progress)
+
+        cached = self._lookup_index(key, selected_quality, url)
+        if cached:
+            return cached
+
+        # Identical requests share one download: threads here via the
+        # single-flight table, other worker processes via a lock file
+        flight_key = f"{key}@{selected_quality}"
+
+        def work(publish):
+            with FileLock(self.lock_dir, flight_key, timeout=self.lock_timeout):
+                # Another thread or worker may have finished it since the check above
+                cached = self._lookup_index(key, selected_quality, url)
+                if cached:
+                    COALESCED_TOTAL.inc(platform=platform, scope="worker")
+                    return cached
+                return self._fetch(url, platform, key, selected_quality, None, publish)
+
+        result, shared = self.flights.run(flight_key, work, progress)
+        if shared:
+            annotate(method="coalesced")
+            COALESCED_TOTAL.inc(platform=platform, scope="process")
+        return result
+
+    def _lookup_index(self, key: str, selected_quality: str, url: str) -> Optional[str]:
+        """Return an "Already downloaded" result if the index has this item."""
+        with stage("index_lookup", method="index") as span:
+            cached = self.index.lookup(key, selected_quality)
+            span["outcome"] = "hit" if cached else "miss"
+        if not cached:
+            return None
+        annotate(method="index")
+        print(f"Serving {url} from download index")
+        return f"Already downloaded to {cached['path']}"
+
+    def _fetch(self, url: str, platform: str, key: str, selected_quality: str, output_name: Optional[str],
+               progress: Optional[Callable[[dict], None]]) -> str:
+        """Download an item that is not on disk yet and record it in the index."""
+        page = None
+        if platform in PAGE_MEDIA_PLATFORMS and not output_name:
             try:
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-                }
-                response = requests.get(url, headers=headers)
-                response_content = response.text
+                with stage("page_fetch", method="http"):
+                    page = self.fetch_page_metadata(url)
             except Exception as e:
                 print(f"Could not fetch preliminary data: {e}")
 
         if not output_name:
-            output_name = self.get_original_filename(url, platform, response_content)
+            with stage("filename"):
+                output_name = self.get_original_filename(url, platform, page)
+
+        output_path = self._output_path(platform, output_name)
+        result = self._run_download_methods(url, platform, output_path, page, selected_quality, progress)
+        self._index_result(key, selected_quality, url, result)
+        return result
 
+    def _output_path(self, platform: str, output_name: str) -> str:
+        """Return where a download is saved, creating the platform's directory."""
         platform_dir = os.path.join(self.output_dir, platform)
-        if not os.path.exists(platform_dir):
-            os.makedirs(platform_dir)
+        os.makedirs(platform_dir, exist_ok=True)
+        return os.path.join(platform_dir, output_name)
 
-        output_path = os.path.join(platform_dir, output_name)
+    def open_stream(self, url: str, selected_quality: str = "7", save_to_disk: bool = False) -> MediaStream:
+        """Open the media behind a URL as a byte stream for sending straight to a client.
 
+        A direct media URL found on the post page (or through tikwm for TikTok)
+        is proxied from its CDN; anything else is piped from ``yt-dlp -o -``.
+        Nothing is written to disk unless ``save_to_disk`` is set, in which case
+        the bytes are also saved under ``downloads/<platform>/`` as they pass.
+        """
+        platform = self.detect_platform(url)
+        url = self._convert_shorts_url(url, platform)
+
+        page = None
+        media = None
         try:
-            return self._use_youtube_dl(url, output_path)
-        except Exception as e:
-            print(f"youtube-dl method failed: {e}")
-            print("Falling back to platform-specific method...")
-            if platform == "instagram":
-                return self.download_instagram(url, output_path, response_content)
-            elif platform == "facebook":
-                return self.download_facebook(url, output_path, response_content)
-            elif platform == "twitter":
-                return self.download_twitter(url, output_path, response_content)
+            if platform in ["instagram", "facebook", "twitter", "reddit"]:
+                page = self.fetch_page_metadata(url)
+                media = self.select_page_media(platform, page)
             elif platform == "tiktok":
-                return self.download_tiktok(url, output_path)
-            elif platform == "pinterest":
-                return self.download_pinterest(url, output_path)
-            elif platform == "reddit":
-                return self.download_reddit(url, output_path, response_content)
-            elif platform == "youtube":
+                video_url = self.resolve_tiktok_video(url)
+                media = (video_url, "video") if video_url else None
+        except Exception as e:
+            print(f"Could not resolve a direct media URL: {e}")
+
+        name = self.get_original_filename(url, platform, page)
+        if media:
+            media_url, kind = media
+            response = self.session.get(media_url, stream=True)
+            if not response.ok:
+                response.close()
+                response.raise_for_status()
+            content_length = response.headers.get('content-length')
+            stream = MediaStream(iter_http(response), f"{name}.{MEDIA_EXTENSIONS[kind]}",
+                                 response.headers.get('content-type', 'application/octet-stream'),
+                                 int(content_length) if content_length else None)
+        else:
+            # Piping to stdout rules out merging, so only single-file formats qualify
+            _, selection = self.resolve_format(url, selected_quality, allow_merge=False)
+            if selection:
+                quality_format = selection["format_id"]
+            else:
+                quality_format = self.QUALITY_OPTIONS.get(selected_quality, self.QUALITY_OPTIONS["7"])['format_id']
+            command = ['yt-dlp', '--quiet', '--no-playlist', '--format', quality_format, '-o', '-', url]
+            print(f"Streaming command: {' '.join(command)}")
+            stream = MediaStream(prime(iter_process(command)), f"{name}.mp4", 'video/mp4')
+
+        if save_to_disk:
+            platform_dir = os.path.join(self.output_dir, platform)
+            os.makedirs(platform_dir, exist_ok=True)
+            stream.chunks = tee_to_file(stream.chunks, os.path.join(platform_dir, stream.filename))
+        return stream
+
+    def _run_download_methods(self, url: str, platform: str, output_path: str,
+                              page: Optional[PageMetadata], selected_quality: str,
+                              progress: Optional[Callable[[dict], None]] = None) -> str:
+        """Try yt-dlp and the platform-specific fallback, best performer first.
+
+        The router orders the two methods from their recent success rate and
+        latency on this platform and skips one whose circuit breaker is open.
+        """
+        result = None
+        error = None
+        for method in self.router.order(platform, DOWNLOAD_METHODS):
+            if not self.router.begin(platform, method):
+                # Another download is already probing this method's circuit
+                continue
+            started = time.monotonic()
+            if method == "ytdlp":
                 try:
-                    return self.download_youtube(url, output_path)
-                except Exception as e2:
-                    return f"All download methods failed: {e2}"
-
-    def download_instagram(self, url: str, output_path: str, response_content: str = None) -> str:
-        """Download media from Instagram without authentication."""
+                    result = self._use_youtube_dl(url, output_path, selected_quality, progress)
+                    success = True
+                except Exception as e:
+                    print(f"youtube-dl method failed: {e}")
+                    error = e
+                    success = False
+            else:
+                with self._fallback_stage(platform) as span:
+                    result = self._run_fallback(url, platform, output_path, page)
+                    success = self._fallback_succeeded(span, result)
+            self._record_attempt(platform, method, success, started)
+            if success:
+                return result
+        if result is None:
+            return f"All download methods failed: {error}"
+        return result
+
+    @contextmanager
+    def _fallback_stage(self, platform: str):
+        """Count and time one run of a platform's fallback handler."""
+        print("Using platform-specific method...")
+        FALLBACKS_TOTAL.inc(platform=platform)
+        with stage("fallback", method="fallback") as span:
+            yield span
+
+    def _fallback_succeeded(self, span: dict, result: str) -> bool:
+        """Return True if a fallback result names a downloaded file, marking the span otherwise."""
+        if self._resolve_result_path(result) is not None:
+            return True
+        span["outcome"] = "error"
+        return False
+
+    def _record_attempt(self, platform: str, method: str, success: bool, started: float):
+        """Report one method's outcome to the router and the current trace."""
+        self.router.record(platform, method, success, time.monotonic() - started)
+        annotate(method=method)
+
+    def _run_fallback(self, url: str, platform: str, output_path: str, page: Optional[PageMetadata]) -> str:
+        """Download with the platform-specific handler instead of yt-dlp."""
+        if platform == "instagram":
+            return self.download_instagram(url, output_path, page)
+        elif platform == "facebook":
+            return self.download_facebook(url, output_path, page)
+        elif platform == "twitter":
+            return self.download_twitter(url, output_path, page)
+        elif platform == "tiktok":
+            return self.download_tiktok(url, output_path)
+        elif platform == "pinterest":
+            return self.download_pinterest(url, output_path)
+        elif platform == "reddit":
+            return self.download_reddit(url, output_path, page)
+        elif platform == "youtube":
+            try:
+                return self.download_youtube(url, output_path)
+            except Exception as e2:
+                return f"All download methods failed: {e2}"
+
+    def _resolve_result_path(self, result: str) -> Optional[str]:
+        """Find the file a download result message refers to."""
+        match = re.search(r' to (.+)$', result or '')
+        if not match:
+            return None
+        path = match.group(1).strip()
+        if os.path.isfile(path):
+            return path
+        # yt-dlp results name the output template without its extension
+        candidates = [p for p in glob.glob(glob.escape(path) + '.*')
+                      if os.path.isfile(p) and not p.endswith(('.part', '.ytdl', '.json', '.tmp'))]
+        if not candidates:
+            return None
+        return max(candidates, key=os.path.getmtime)
+
+    def _index_result(self, key: str, selected_quality: str, url: str, result: str):
+        """Record a successful download in the persistent index."""
+        path = self._resolve_result_path(result)
+        if not path:
+            return
         try:
-            if not response_content:
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-                }
-                response = requests.get(url, headers=headers)
-                response_content = response.text
-
-            video_urls = re.findall(r'<meta property="og:video" content="([^"]+)"', response_content)
-            if video_urls:
-                video_path = f"{output_path}.mp4"
-                self._download_file(video_urls[0], video_path)
-                return f"Downloaded Instagram video to {video_path}"
-
-            image_urls = re.findall(r'<meta property="og:image" content="([^"]+)"', response_content)
-            if image_urls:
-                image_path = f"{output_path}.jpg"
-                self._download_file(image_urls[0], image_path)
-                return f"Downloaded Instagram image to {image_path}"
-
-            return "No media found in Instagram post"
-
+            self.index.record(key, selected_quality, url, path)
         except Exception as e:
-            return f"Instagram download error: {e}"
+            print(f"Could not update download index: {e}")
 
-    def download_facebook(self, url: str, output_path: str, response_content: str = None) -> str:
-        """Download media from Facebook without authentication."""
+    def select_page_media(self, platform: str, page: PageMetadata) -> Optional[tuple]:
+        """Pick the media URL a post page advertises, as ``(url, kind)``."""
+        if platform == "reddit":
+            video_urls = page.all('og:video', 'og:video:secure_url')
+        else:
+            video_urls = page.all('og:video')
+        if video_urls:
+            return video_urls[0], "video"
+
+        image_urls = page.all('og:image')
+        if platform == "twitter":
+            image_urls = [url for url in image_urls if 'profile_images' not in url]
+        elif platform == "reddit":
+            image_urls = [url for url in image_urls if 'external-preview' in url or 'i.redd.it' in url]
+        if image_urls:
+            return image_urls[0], "image"
+        return None
+
+    def _page_media_target(self, platform: str, page: PageMetadata, output_path: str) -> Optional[tuple]:
+        """Return ``(media URL, file path, kind)`` for the media a post page advertises."""
+        media = self.select_page_media(platform, page)
+        if not media:
+            return None
+        media_url, kind = media
+        return media_url, f"{output_path}.{MEDIA_EXTENSIONS[kind]}", kind
+
+    @staticmethod
+    def _page_media_result(platform: str, target: Optional[tuple] = None,
+                           error: Optional[Exception] = None) -> str:
+        """Result string of a post page fallback, given the downloaded target or the error raised."""
+        label, not_found = PAGE_MEDIA_PLATFORMS[platform]
+        if error is not None:
+            return f"{label} download error: {error}"
+        if target is None:
+            return not_found
+        _, media_path, kind = target
+        return f"Downloaded {label} {kind} to {media_path}"
+
+    def _download_page_media(self, url: str, output_path: str, page: Optional[PageMetadata],
+                             platform: str) -> str:
+        """Download the media advertised by a post page's og: tags."""
         try:
-            if not response_content:
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-                }
-                response = requests.get(url, headers=headers)
-                response_content = response.text
-
-            video_urls = re.findall(r'<meta property="og:video" content="([^"]+)"', response_content)
-            if video_urls:
-                video_path = f"{output_path}.mp4"
-                self._download_file(video_urls[0], video_path)
-                return f"Downloaded Facebook video to {video_path}"
-
-            image_urls = re.findall(r'<meta property="og:image" content="([^"]+)"', response_content)
-            if image_urls:
-                image_path = f"{output_path}.jpg"
-                self._download_file(image_urls[0], image_path)
-                return f"Downloaded Facebook image to {image_path}"
+            if page is None:
+                page = self.fetch_page_metadata(url)
+            target = self._page_media_target(platform, page, output_path)
+            if target:
+                self._download_file(target[0], target[1])
+            return self._page_media_result(platform, target)
+        except Exception as e:
+            return self._page_media_result(platform, error=e)
 
-            return "No media found in Facebook post"
+    def download_instagram(self, url: str, output_path: str, page: Optional[PageMetadata] = None) -> str:
+        """Download media from Instagram without authentication."""
+        return self._download_page_media(url, output_path, page, "instagram")
 
-        except Exception as e:
-            return f"Facebook download error: {e}"
+    def download_facebook(self, url: str, output_path: str, page: Optional[PageMetadata] = None) -> str:
+        """Download media from Facebook without authentication."""
+        return self._download_page_media(url, output_path, page, "facebook")
 
-    def download_twitter(self, url: str, output_path: str, response_content: str = None) -> str:
+    def download_twitter(self, url: str, output_path: str, page: Optional[PageMetadata] = None) -> str:
         """Download media from Twitter/X without authentication."""
-        try:
-            if not response_content:
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-                }
-                response = requests.get(url, headers=headers)
-                response_content = response.text
-
-            video_urls = re.findall(r'<meta property="og:video" content="([^"]+)"', response_content)
-            if video_urls:
-                video_path = f"{output_path}.mp4"
-                self._download_file(video_urls[0], video_path)
-                return f"Downloaded Twitter/X video to {video_path}"
-
-            image_urls = re.findall(r'<meta property="og:image" content="([^"]+)"', response_content)
-            if image_urls:
-                media_urls = [url for url in image_urls if 'profile_images' not in url]
-                if media_urls:
-                    image_path = f"{output_path}.jpg"
-                    self._download_file(media_urls[0], image_path)
-                    return f"Downloaded Twitter/X image to {image_path}"
-            return "No media found in Twitter/X post"
-
-        except Exception as e:
-            return f"Twitter/X download error: {e}"
+        return self._download_page_media(url, output_path, page, "twitter")
+
+    def resolve_tiktok_video(self, url: str) -> Optional[str]:
+        """Look up the direct video URL of a TikTok post through the tikwm API."""
+        tiktok_api_url = f"https://www.tikwm.com/api/?url={url}"
+        response = self.session.get(tiktok_api_url)
+        data = response.json()
+        if data.get("success"):
+            return data.get("data", {}).get("play")
+        return None
+
+    @staticmethod
+    def _tiktok_result(video_path: Optional[str] = None, error: Optional[Exception] = None) -> str:
+        """Result string of the TikTok fallback, given the downloaded file or the error raised."""
+        if error is not None:
+            return f"TikTok download error: {error}"
+        if video_path is None:
+            return "Failed to download TikTok video. Try using youtube-dl directly."
+        return f"Downloaded TikTok video to {video_path}"
 
     def download_tiktok(self, url: str, output_path: str) -> str:
         """Download videos from TikTok without authentication."""
         try:
-            tiktok_api_url = f"https://www.tikwm.com/api/?url={url}"
-            response = requests.get(tiktok_api_url)
-            data = response.json()
-
-            if data.get("success"):
-                video_url = data.get("data", {}).get("play")
-                if video_url:
-                    video_path = f"{output_path}.mp4"
-                    self._download_file(video_url, video_path)
-                    return f"Downloaded TikTok video to {video_path}"
-
-            return "Failed to download TikTok video. Try using youtube-dl directly."
-
+            video_url = self.resolve_tiktok_video(url)
+            video_path = None
+            if video_url:
+                video_path = f"{output_path}.mp4"
+                self._download_file(video_url, video_path)
+            return self._tiktok_result(video_path)
         except Exception as e:
-            return f"TikTok download error: {e}"
+            return self._tiktok_result(error=e)
 
     def download_youtube(self, url: str, output_path: str) -> str:
         """Download videos from YouTube using pytube as an alternative."""
         try:
             from pytube import YouTube
         except ImportError:
-            print("pytube not found. Installing...")
-            os.system("pip install pytube")
-            from pytube import YouTube
+            raise RuntimeError("The YouTube fallback needs pytube, which is not installed "
+                               "(install it with 'pip install pytube')") from None
 
         try:
             yt = YouTube(url)
@@ -334,36 +633,9 @@ class MediaDownloader:
             print(f"pytube download error: {e}")
             raise
 
-    def download_reddit(self, url: str, output_path: str, response_content: str = None) -> str:
+    def download_reddit(self, url: str, output_path: str, page: Optional[PageMetadata] = None) -> str:
         """Download media from Reddit without authentication."""
-        try:
-            if not response_content:
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-                }
-                response = requests.get(url, headers=headers)
-                response_content = response.text
-
-            video_urls = re.findall(r'<meta property="og:video" content="([^"]+)"', response_content)
-            video_urls += re.findall(r'<meta property="og:video:secure_url" content="([^"]+)"', response_content)
-
-            if video_urls:
-                video_path = f"{output_path}.mp4"
-                self._download_file(video_urls[0], video_path)
-                return f"Downloaded Reddit video to {video_path}"
-
-            image_urls = re.findall(r'<meta property="og:image" content="([^"]+)"', response_content)
-            if image_urls:
-                media_urls = [url for url in image_urls if 'external-preview' in url or 'i.redd.it' in url]
-                if media_urls:
-                    image_path = f"{output_path}.jpg"
-                    self._download_file(media_urls[0], image_path)
-                    return f"Downloaded Reddit image to {image_path}"
-
-            return "No media found in Reddit post. Try using youtube-dl with --verbose flag to debug."
-
-        except Exception as e:
-            return f"Reddit download error: {e}"
+        return self._download_page_media(url, output_path, page, "reddit")
 
     def download_pinterest(self, url: str, output_path: str) -> str:
         """Download images from Pinterest."""
@@ -371,17 +643,15 @@ class MediaDownloader:
 
     def _download_file(self, url: str, output_path: str):
         """Helper method to download a file from a URL with progress bar."""
+        import requests
+        from file_transfer import stream_download
+
         try:
-            response = requests.get(url, stream=True)
-            response.raise_for_status()
-            total_size = int(response.headers.get('content-length', 0))
-            block_size = 8192
-
-            with tqdm(total=total_size, unit='B', unit_scale=True, desc=output_path, ascii=True) as pbar:
-                with open(output_path, 'wb') as file:
-                    for data in response.iter_content(block_size):
-                        file.write(data)
-                        pbar.update(len(data))
+            # Large files on Range-capable servers are fetched in parallel segments
+            stream_download(self.session, url, output_path, buffer_size=self.buffer_size,
+                            show_progress=self.show_progress, scheduler=self.scheduler,
+                            segments=self.download_segments, segment_min_size=self.segment_min_size,
+                            priority=current_priority())
         except requests.exceptions.RequestException as e:
             print(f"Download failed: {e}")
             raise
@@ -389,31 +659,51 @@ class MediaDownloader:
             print(f"IOError: {e}")
             raise
 
-    def _use_youtube_dl(self, url: str, output_path: str) -> str:
-        """Use yt-dlp to download media from various platforms, capturing output."""
+    def _run_ytdlp(self, command: list, progress: Optional[Callable[[dict], None]] = None) -> int:
+        """Run yt-dlp, reading its output line by line as it is produced.
+
+        Progress lines are parsed into events and handed to ``progress``
+        instead of being logged; everything else is printed as it arrives.
+        Nothing is buffered beyond the current line.
+        """
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   text=True, errors='replace', bufsize=1)
+        with process.stdout:
+            for line in process.stdout:
+                line = line.rstrip()
+                event = parse_ytdlp_line(line)
+                if event and progress:
+                    progress(event)
+                if event is None or 'percent' not in event:
+                    print(f"yt-dlp: {line}")
+        return process.wait()
+
+    def _use_youtube_dl(self, url: str, output_path: str, selected_quality: Optional[str] = None,
+                        progress: Optional[Callable[[dict], None]] = None) -> str:
+        """Use yt-dlp to download media from various platforms, capturing output.
+
+        The exact format is chosen up front from the cached format table, so
+        yt-dlp runs once and never has to retry with a looser selector.
+        """
         try:
-            quality_format = self.QUALITY_OPTIONS[self.selected_quality]['format_id']
-
-            # Get original filename for YouTube first
-            if "youtube.com" in url or "youtu.be" in url:
-                # Extract title first using get-title
-                title_command = [
-                    'yt-dlp',
-                    '--get-title',
-                    '--no-playlist',
-                    url
-                ]
-                try:
-                    title_result = subprocess.run(title_command, capture_output=True, text=True)
-                    if title_result.returncode == 0 and title_result.stdout.strip():
-                        original_title = title_result.stdout.strip()
-                        original_title = re.sub(r'[\\/*?:"<>|]', "_", original_title)
-                        if len(original_title) > 100:
-                            original_title = original_title[:100]
-                        output_path = os.path.dirname(output_path) + os.sep + original_title
-                        print(f"Using YouTube original title: {original_title}")
-                except Exception as e:
-                    print(f"Failed to get YouTube title: {e}")
+            quality = selected_quality or self.selected_quality
+            info, selection = self.resolve_format(url, quality)
+            if info is None:
+                raise Exception("yt-dlp could not extract this URL")
+
+            if selection:
+                print(f"Selected format {selection['format_id']} ({selection['label']}) "
+                      f"for quality {self.QUALITY_OPTIONS.get(quality, self.QUALITY_OPTIONS['7'])['resolution']}")
+                if progress:
+                    progress({"stage": "format", "format_id": selection["format_id"], "quality": selection["label"]})
+
+            # Keep YouTube's original title as the file name
+            if ("youtube.com" in url or "youtu.be" in url) and info.get('title'):
+                original_title = re.sub(r'[\\/*?:"<>|]', "_", info['title'])
+                if len(original_title) > 100:
+                    original_title = original_title[:100]
+                output_path = os.path.dirname(output_path) + os.sep + original_title
+                print(f"Using YouTube original title: {original_title}")
 
             output_template = f'{output_path}.%(ext)s'
 
@@ -421,64 +711,160 @@ class MediaDownloader:
                 command = [
                     'yt-dlp',
                     '--verbose',
+                    '--newline',
                     '--merge-output-format', 'mp4',
                     '--embed-metadata',
                     '--add-metadata',
                     '-o', output_template,
-                    url
                 ]
             else:
                 command = [
                     'yt-dlp',
+                    '--newline',
                     '-o', output_template,
-                    '--format', quality_format,
                     '--merge-output-format', 'mp4',
-                    url
                 ]
+            if selection:
+                command += ['--format', selection['format_id']]
 
-            print(f"Running command: {' '.join(command)}")
-            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = process.communicate()
-
-            print("yt-dlp stdout:\n", stdout.decode('utf-8'))
-            print("yt-dlp stderr:\n", stderr.decode('utf-8'))
-
-            if process.returncode != 0:
-                print("Selected format not available. Trying without format specification...")
-                command.remove('--format')
-                if quality_format in command:
-                    command.remove(quality_format)
-
-                print(f"Running fallback command: {' '.join(command)}")
-                process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                stdout, stderr = process.communicate()
-
-                print("yt-dlp stdout (fallback):\n", stdout.decode('utf-8'))
-                print("yt-dlp stderr (fallback):\n", stderr.decode('utf-8'))
-
-                if process.returncode != 0:
-                    raise Exception(f"yt-dlp exited with code {process.returncode}")
+            # Reuse the extracted metadata so yt-dlp skips re-extraction
+            info_file = tempfile.NamedTemporaryFile('w', suffix='.info.json', delete=False)
+            with info_file:
+                json.dump(info, info_file)
+            command += ['--load-info-json', info_file.name]
 
+            try:
+                with self.scheduler.transfer(url), stage("ytdlp", method="ytdlp") as span:
+                    rate_limit = self.scheduler.ytdlp_rate_limit(url)
+                    if rate_limit:
+                        command += ['--limit-rate', str(rate_limit)]
+                    print(f"Running command: {' '.join(command)}")
+                    returncode = self._run_ytdlp(command, progress)
+                    if returncode != 0:
+                        span["outcome"] = "error"
+            finally:
+                os.remove(info_file.name)
+
+            if returncode != 0:
+                # The cached direct URLs may have gone stale; extract afresh next time
+                self.metadata_cache.discard(url)
+                raise Exception(f"yt-dlp exited with code {returncode}")
+
+            if selection:
+                return f"Downloaded {selection['label']} to {output_path}"
             return f"Downloaded to {output_path}"
         except Exception as e:
             print(f"yt-dlp download error: {e}")
             raise
 
-downloader = MediaDownloader()
-
-@app.route('/')
-def index():
-    return render_template('index.html')
-
-@app.route('/download', methods=['POST'])
-def download():
-    url = request.form['url']
-    selected_quality = request.form.get('selected_quality', '7')
-    try:
-        result = downloader.download(url, selected_quality)
-        return render_template('index.html', result=result)
-    except Exception as e:
-        return render_template('index.html', result=f"Download failed: {e}")
+def downloader_from_env(**overrides) -> MediaDownloader:
+    """Build a MediaDownloader configured from the DOWNLOAD_* environment variables."""
+    options = dict(
+        index_max_bytes=int(os.environ.get("DOWNLOAD_CACHE_MAX_MB", "0")) * 1024 * 1024 or None,
+        trace_hook=JsonlTraceWriter(os.environ["DOWNLOAD_TRACE_LOG"]) if os.environ.get("DOWNLOAD_TRACE_LOG") else None,
+        buffer_size=int(os.environ.get("DOWNLOAD_BUFFER_KB", "1024")) * 1024,
+        scheduler=TransferScheduler(
+            global_rate=int(os.environ.get("DOWNLOAD_RATE_LIMIT_KB", "0")) * 1024 or None,
+            host_rate=int(os.environ.get("DOWNLOAD_HOST_RATE_LIMIT_KB", "0")) * 1024 or None,
+            host_connections=int(os.environ.get("DOWNLOAD_HOST_CONNECTIONS", "8")),
+            bulk_share=float(os.environ.get("DOWNLOAD_BULK_SHARE", "0.25")),
+        ),
+    )
+    options.update(overrides)
+    return MediaDownloader(**options)
+
+
+# The web app and its shared downloader live in web_app, which is only
+# imported when asked for, so the CLI never loads Flask
+_WEB_APP_NAMES = {"app", "downloader", "job_queue", "batch_downloader"}
+
+
+def __getattr__(name):
+    if name in _WEB_APP_NAMES:
+        import web_app
+        return getattr(web_app, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def main(argv=None):
+    """Command-line entry point; ``python -m media_downloader --help`` lists the commands.
+
+    Only ``serve`` imports Flask, so scripted downloads start quickly.
+    """
+    parser = argparse.ArgumentParser(description="Multi-platform media downloader")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("serve", help="Run the web interface (default)")
+    download_parser = subparsers.add_parser("download", help="Download one or more URLs")
+    download_parser.add_argument("urls", nargs="+", help="Media URLs")
+    download_parser.add_argument("-q", "--quality", default="7", choices=sorted(MediaDownloader.QUALITY_OPTIONS),
+                                 help="Quality option (1=144p ... 7=best)")
+    download_parser.add_argument("-o", "--output-dir", default="downloads", help="Directory to save into")
+    playlist_parser = subparsers.add_parser("playlist", help="Download a playlist, channel or listing")
+    playlist_parser.add_argument("url", help="Playlist, channel or listing URL")
+    playlist_parser.add_argument("-q", "--quality", default="7", choices=sorted(MediaDownloader.QUALITY_OPTIONS),
+                                 help="Quality option (1=144p ... 7=best)")
+    playlist_parser.add_argument("-w", "--workers", type=int, default=8, help="Total concurrent downloads")
+    playlist_parser.add_argument("--limit", type=int, help="Download at most this many new entries")
+    playlist_parser.add_argument("--start", type=int, help="First playlist index to consider (1-based)")
+    playlist_parser.add_argument("--end", type=int, help="Last playlist index to consider")
+    playlist_parser.add_argument("--date-after", type=parse_date, help="Only entries uploaded on/after YYYYMMDD")
+    playlist_parser.add_argument("--date-before", type=parse_date, help="Only entries uploaded on/before YYYYMMDD")
+    playlist_parser.add_argument("--redownload", action="store_true", help="Do not skip entries already on disk")
+    batch_parser = subparsers.add_parser("batch", help="Download every URL listed in a file or stdin")
+    batch_parser.add_argument("source", nargs="?", default="-", help="File with one URL per line, or - for stdin")
+    batch_parser.add_argument("-q", "--quality", default="7", choices=sorted(MediaDownloader.QUALITY_OPTIONS),
+                              help="Quality option (1=144p ... 7=best)")
+    batch_parser.add_argument("-w", "--workers", type=int, default=8, help="Total concurrent downloads")
+    args = parser.parse_args(argv)
+
+    if args.command == "download":
+        downloader = downloader_from_env(output_dir=args.output_dir)
+        failed = 0
+        for url in args.urls:
+            try:
+                result = downloader.download(url, args.quality)
+            except Exception as e:
+                result = f"Download failed: {e}"
+            if downloader._resolve_result_path(result):
+                print(f"OK   {url}: {result}", flush=True)
+            else:
+                failed += 1
+                print(f"FAIL {url}: {result}", flush=True)
+        return 1 if failed else 0
+
+    if args.command in ("batch", "playlist"):
+        from batch_download import BatchDownloader, read_urls
+        downloader = downloader_from_env()
+        runner = BatchDownloader(downloader, max_workers=args.workers)
+        if args.command == "playlist":
+            source = nullcontext()
+            urls = expansion = PlaylistExpansion(
+                downloader, args.url, args.quality, limit=args.limit, start=args.start, end=args.end,
+                date_after=args.date_after, date_before=args.date_before, skip_existing=not args.redownload,
+                on_skip=lambda url: print(f"SKIP {url}: already downloaded", flush=True))
+        else:
+            source = sys.stdin if args.source == "-" else open(args.source)
+            urls = read_urls(source)
+        failed = 0
+        with source:
+            try:
+                for item in runner.run(urls, args.quality):
+                    if item["status"] == "finished":
+                        print(f"OK   {item['url']}: {item['result']}", flush=True)
+                    else:
+                        failed += 1
+                        print(f"FAIL {item['url']}: {item['error']}", flush=True)
+            except IOError as e:
+                print(f"FAIL {e}", flush=True)
+                return 1
+        if args.command == "playlist":
+            counts = expansion.summary()
+            print(f"{counts['discovered']} entries listed: {counts['queued']} downloaded or attempted, "
+                  f"{counts['skipped']} already downloaded, {counts['filtered']} outside the date range")
+        return 1 if failed else 0
+
+    from web_app import app
+    app.run(debug=True)
+    return 0
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,58 @@
+from typing import Optional
+
+
+def _has_video(fmt: dict) -> bool:
+    return fmt.get("vcodec") != "none"
+
+
+def _has_audio(fmt: dict) -> bool:
+    return fmt.get("acodec") != "none"
+
+
+def _bitrate(fmt: dict) -> float:
+    return fmt.get("tbr") or fmt.get("vbr") or fmt.get("abr") or 0
+
+
+def _closest(candidates: list, max_height: Optional[int]) -> Optional[dict]:
+    """Tallest format not above ``max_height`` (highest bitrate on ties), else the smallest one."""
+    if not candidates:
+        return None
+    below = [f for f in candidates if max_height is None or (f.get("height") or 0) <= max_height]
+    if below:
+        return max(below, key=lambda f: (f.get("height") or 0, _bitrate(f)))
+    return min(candidates, key=lambda f: (f.get("height") or 0, -_bitrate(f)))
+
+
+def format_label(fmt: dict) -> str:
+    """Human-readable quality of a format, e.g. ``720p``."""
+    if fmt.get("height"):
+        return f"{fmt['height']}p"
+    return fmt.get("format_note") or fmt.get("format_id") or "unknown"
+
+
+def select_format(formats: list, max_height: Optional[int] = None, allow_merge: bool = True) -> Optional[dict]:
+    """Pick the yt-dlp format to download from an extracted format table.
+
+    Formats carrying both audio and video are preferred, since they play
+    without ffmpeg: the tallest one not above ``max_height``, or the smallest
+    one if all are taller.  If the site only offers separate streams and
+    ``allow_merge`` is set, the matching video stream is paired with the
+    best audio stream as ``<video>+<audio>``.
+
+    Returns ``{"format_id", "height", "label"}`` or None if nothing fits.
+    """
+    videos = [f for f in formats if _has_video(f) and f.get("format_id")]
+    combined = _closest([f for f in videos if _has_audio(f)], max_height)
+    if combined:
+        return {"format_id": combined["format_id"], "height": combined.get("height"), "label": format_label(combined)}
+    if not allow_merge:
+        return None
+
+    video = _closest(videos, max_height)
+    audio = [f for f in formats if _has_audio(f) and not _has_video(f) and f.get("format_id")]
+    if not video or not audio:
+        return None
+    best_audio = max(audio, key=_bitrate)
+    return {"format_id": f"{video['format_id']}+{best_audio['format_id']}", "height": video.get("height"),
+            "label": format_label(video)}
+
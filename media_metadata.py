@@ -0,0 +1,109 @@
+import json
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+
+# Query parameters that only carry tracking/share information
+TRACKING_PARAMS = {"si", "igshid", "igsh", "fbclid", "feature", "ref", "ref_src", "ref_url", "share_id"}
+
+
+def normalize_url(url: str) -> str:
+    """Return a canonical form of a media URL for use as a cache key.
+
+    The host is lowercased with ``www.``/``m.`` prefixes dropped, fragments and
+    tracking parameters are removed, and YouTube Shorts and youtu.be links are
+    rewritten to ``https://www.youtube.com/watch?v=<id>``.
+    """
+    parsed = urlparse(url.strip())
+    host = parsed.netloc.lower()
+    for prefix in ("www.", "m.", "mobile."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    path = parsed.path.rstrip("/") or "/"
+    query = [(k, v) for k, v in parse_qsl(parsed.query) if k not in TRACKING_PARAMS and not k.startswith("utm_")]
+
+    if host in ("youtube.com", "youtu.be"):
+        video_id = None
+        if host == "youtu.be":
+            video_id = path.strip("/")
+        elif path.startswith("/shorts/"):
+            video_id = path[len("/shorts/"):].split("/")[0]
+        elif path == "/watch":
+            video_id = dict(query).get("v")
+        if video_id:
+            return f"https://www.youtube.com/watch?v={video_id}"
+        host = "youtube.com"
+
+    return urlunparse(("https", host, path, "", urlencode(sorted(query)), ""))
+
+
+class MetadataCache:
+    """Thread-safe LRU cache of extracted metadata with per-entry expiry."""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> Optional[dict]:
+        """Return cached metadata for a URL, or None if missing or expired."""
+        key = normalize_url(url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, info = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return info
+
+    def put(self, url: str, info: dict):
+        """Store metadata for a URL, evicting the least recently used entry."""
+        key = normalize_url(url)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), info)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, url: str):
+        """Forget the metadata cached for a URL."""
+        with self._lock:
+            self._entries.pop(normalize_url(url), None)
+
+    def clear(self):
+        """Drop every cached entry."""
+        with self._lock:
+            self._entries.clear()
+
+
+def extract_metadata(url: str) -> dict:
+    """Extract title, formats and direct media URLs for a URL in one pass.
+
+    Uses the in-process ``yt_dlp`` API when the package is importable, which
+    avoids paying interpreter start-up and extractor initialisation again;
+    otherwise runs a single ``yt-dlp -J`` subprocess.  The returned dict is the
+    JSON-safe yt-dlp info dict, so it can be fed back via ``--load-info-json``.
+    """
+    try:
+        import yt_dlp
+    except ImportError:
+        yt_dlp = None
+
+    if yt_dlp is not None:
+        options = {"quiet": True, "no_warnings": True, "noplaylist": True, "skip_download": True}
+        with yt_dlp.YoutubeDL(options) as ydl:
+            info = ydl.extract_info(url, download=False)
+            return ydl.sanitize_info(info)
+
+    command = ['yt-dlp', '-J', '--no-playlist', url]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"yt-dlp metadata extraction failed: {result.stderr.strip()}")
+    return json.loads(result.stdout)
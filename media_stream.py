@@ -0,0 +1,82 @@
+import os
+import subprocess
+from typing import Iterator, Optional
+
+CHUNK_SIZE = 64 * 1024
+
+
+class MediaStream:
+    """Media bytes on their way to a client, plus the headers to send with them."""
+
+    def __init__(self, chunks: Iterator[bytes], filename: str, content_type: str = 'application/octet-stream',
+                 content_length: Optional[int] = None):
+        self.chunks = chunks
+        self.filename = filename
+        self.content_type = content_type
+        self.content_length = content_length
+
+
+def iter_http(response, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield the body of a streamed response and release its connection afterwards."""
+    with response:
+        for chunk in response.iter_content(chunk_size):
+            if chunk:
+                yield chunk
+
+
+def iter_process(command: list, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield a subprocess's stdout as it is written.
+
+    The process is killed if the consumer stops early (for example when the
+    client disconnects), and a non-zero exit is raised as an error.
+    """
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            chunk = process.stdout.read1(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.stdout.close()
+        returncode = process.wait()
+    if returncode != 0:
+        raise IOError(f"{command[0]} exited with code {returncode}")
+
+
+def prime(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Pull the first chunk now so a source that fails at once raises here.
+
+    Without this, errors would only surface after response headers had gone out.
+    """
+    chunks = iter(chunks)
+    first = next(chunks, b'')
+
+    def generate():
+        if first:
+            yield first
+        yield from chunks
+
+    return generate()
+
+
+def tee_to_file(chunks: Iterator[bytes], output_path: str) -> Iterator[bytes]:
+    """Pass chunks through while also saving them to ``output_path``.
+
+    Data goes to ``<output>.part`` and is only renamed into place once the
+    stream has been read to the end, so a dropped client leaves no partial file.
+    """
+    part_path = f"{output_path}.part"
+    completed = False
+    try:
+        with open(part_path, 'wb') as file:
+            for chunk in chunks:
+                file.write(chunk)
+                yield chunk
+        completed = True
+        os.replace(part_path, output_path)
+    finally:
+        if not completed and os.path.exists(part_path):
+            os.remove(part_path)
@@ -0,0 +1,174 @@
+import threading
+import time
+from collections import deque
+
+
+class CircuitBreaker:
+    """Skips a download method while it keeps failing.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and the
+    method is skipped for ``cooldown`` seconds.  Then a single caller is let
+    through as a half-open probe: success closes the circuit, failure opens
+    it again with the cooldown doubled (up to ``max_cooldown``).
+    """
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 60, max_cooldown: float = 900):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.probe_started = 0.0
+
+    def available(self, now: float) -> bool:
+        """Return True if the method may be tried now, without claiming the probe."""
+        if self.state == "closed":
+            return True
+        if self.state == "open" and now - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+        # A probe that never reported back is given up on after one cooldown
+        return self.state == "half_open" and (not self.probe_in_flight or now - self.probe_started >= self.cooldown)
+
+    def allow(self, now: float) -> bool:
+        """Return True if the method may be tried now, claiming the probe if half-open."""
+        if not self.available(now):
+            return False
+        if self.state == "half_open":
+            self.probe_in_flight = True
+            self.probe_started = now
+        return True
+
+    def record(self, success: bool, now: float):
+        self.probe_in_flight = False
+        if success:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self.cooldown = self.base_cooldown
+            return
+        self.consecutive_failures += 1
+        if self.state == "half_open":
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            self._open(now)
+        elif self.consecutive_failures >= self.failure_threshold:
+            self._open(now)
+
+    def _open(self, now: float):
+        self.state = "open"
+        self.opened_at = now
+        print(f"Circuit opened for {self.cooldown:.0f}s after {self.consecutive_failures} failures")
+
+
+class MethodStats:
+    """Success rate and latency over the most recent attempts of one method."""
+
+    def __init__(self, window: int = 20):
+        self.attempts = deque(maxlen=window)
+
+    def record(self, success: bool, latency: float):
+        self.attempts.append((success, latency))
+
+    @property
+    def success_rate(self) -> float:
+        """Observed success rate with a uniform prior, so new methods start at 0.5."""
+        successes = sum(1 for success, _ in self.attempts if success)
+        return (successes + 1) / (len(self.attempts) + 2)
+
+    @property
+    def mean_latency(self) -> float:
+        latencies = [latency for success, latency in self.attempts if success]
+        return sum(latencies) / len(latencies) if latencies else float("inf")
+
+
+class MethodRouter:
+    """Orders download methods per platform by how well they have been doing.
+
+    Tracks recent outcomes for every ``(platform, method)`` pair.  ``order``
+    puts the method most likely to succeed first (faster first among similar
+    success rates) and leaves out methods whose circuit breaker is open.  A
+    method due for a half-open probe goes first so the probe really runs.
+    Callers ``begin`` each method as they try it, which claims the probe, so
+    methods listed but never tried do not hold it.
+
+    Methods are only reranked once they have ``min_samples`` attempts, and
+    every ``explore_every``-th request per platform keeps the default order so
+    a demoted method keeps getting measured.
+    """
+
+    def __init__(self, window: int = 20, failure_threshold: int = 3, cooldown: float = 60,
+                 max_cooldown: float = 900, min_samples: int = 5, explore_every: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self.explore_every = explore_every
+        self._requests = {}
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._stats = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, platform: str, method: str):
+        key = (platform, method)
+        if key not in self._stats:
+            self._stats[key] = MethodStats(self.window)
+            self._breakers[key] = CircuitBreaker(self.failure_threshold, self.cooldown, self.max_cooldown)
+        return self._stats[key], self._breakers[key]
+
+    def order(self, platform: str, methods: list) -> list:
+        """Return the methods to try for a platform, best first.
+
+        If every method's circuit is open, all of them are returned in their
+        default order rather than failing without trying anything.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._requests[platform] = self._requests.get(platform, 0) + 1
+            explore = self.explore_every and self._requests[platform] % self.explore_every == 0
+            ranked = []
+            for index, method in enumerate(methods):
+                stats, breaker = self._entry(platform, method)
+                if not breaker.available(now):
+                    continue
+                probe = 0 if breaker.state == "half_open" else 1
+                if explore or len(stats.attempts) < self.min_samples:
+                    ranked.append((probe, -0.5, float("inf"), index, method))
+                else:
+                    ranked.append((probe, -round(stats.success_rate, 1), stats.mean_latency, index, method))
+        if not ranked:
+            print(f"All download methods for {platform} are failing; trying them anyway")
+            return list(methods)
+        return [method for *_, method in sorted(ranked)]
+
+    def begin(self, platform: str, method: str) -> bool:
+        """Claim a method's half-open probe just before trying it.
+
+        Returns False if another caller already holds the probe.  A method
+        whose circuit is still open is only listed when every method is
+        failing, and is let through.
+        """
+        with self._lock:
+            _, breaker = self._entry(platform, method)
+            return breaker.allow(time.monotonic()) or breaker.state == "open"
+
+    def record(self, platform: str, method: str, success: bool, latency: float):
+        """Record the outcome of one attempt."""
+        with self._lock:
+            stats, breaker = self._entry(platform, method)
+            stats.record(success, latency)
+            breaker.record(success, time.monotonic())
+
+    def snapshot(self) -> dict:
+        """Return success rate, latency and circuit state for every pair seen."""
+        with self._lock:
+            return {
+                f"{platform}/{method}": {
+                    "success_rate": stats.success_rate,
+                    "mean_latency": stats.mean_latency,
+                    "attempts": len(stats.attempts),
+                    "circuit": self._breakers[(platform, method)].state,
+                }
+                for (platform, method), stats in self._stats.items()
+            }
@@ -0,0 +1,270 @@
+import json
+import math
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, math.inf)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key: tuple, value) -> list:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, one series per label combination."""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, such as a queue depth."""
+
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def clear(self):
+        """Drop every series, e.g. before re-filling a gauge from a snapshot."""
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (e.g. latencies) over fixed buckets."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        if self.buckets[-1] != math.inf:
+            self.buckets += (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.setdefault(key, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def _render_sample(self, key: tuple, state) -> list:
+        lines = []
+        for bound, count in zip(self.buckets, state["counts"]):
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+        lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together in Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "media_downloader_stage_seconds", "Time spent in each stage of a download.",
+    ("stage", "platform", "method", "outcome")))
+DOWNLOAD_SECONDS = REGISTRY.register(Histogram(
+    "media_downloader_download_seconds", "End-to-end latency of MediaDownloader.download.",
+    ("platform", "method", "outcome")))
+DOWNLOADS_TOTAL = REGISTRY.register(Counter(
+    "media_downloader_downloads_total", "Downloads finished, by the method that produced the file.",
+    ("platform", "method", "outcome")))
+FALLBACKS_TOTAL = REGISTRY.register(Counter(
+    "media_downloader_fallbacks_total", "Downloads that fell back to a platform-specific handler.",
+    ("platform",)))
+COALESCED_TOTAL = REGISTRY.register(Counter(
+    "media_downloader_coalesced_total", "Downloads served by waiting on an identical in-flight download.",
+    ("platform", "scope")))
+BYTES_TOTAL = REGISTRY.register(Counter(
+    "media_downloader_bytes_total", "Bytes of media written to disk.",
+    ("platform", "method")))
+SCHEDULED_BYTES_TOTAL = REGISTRY.register(Counter(
+    "media_downloader_scheduled_bytes_total", "Bytes read through the transfer scheduler.",
+    ("priority",)))
+THROTTLE_SECONDS_TOTAL = REGISTRY.register(Counter(
+    "media_downloader_throttle_seconds_total", "Time transfers spent sleeping on bandwidth caps.",
+    ("priority",)))
+
+# A context variable rather than a thread-local, so every asyncio task (and
+# every thread) sees only its own download
+_current = ContextVar("download_trace", default=None)
+
+
+def current_trace() -> Optional["DownloadTrace"]:
+    """Return the trace of the download running in this thread or task, if any."""
+    return _current.get()
+
+
+class DownloadTrace:
+    """Timing spans for one call to MediaDownloader.download.
+
+    Used as a context manager, the trace becomes current for the calling
+    thread or asyncio task so nested code can open spans with ``stage`` without passing it
+    around.  On exit the whole-download metrics are recorded and the trace is
+    handed to ``hook`` (if set).
+    """
+
+    def __init__(self, url: str, hook: Optional[Callable[[dict], None]] = None):
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.hook = hook
+        self.platform = "unknown"
+        self.method = "none"
+        self.outcome = "error"
+        self.spans = []
+        self._started = None
+        self._started_wall = None
+        self._previous = None
+
+    def __enter__(self):
+        self._previous = current_trace()
+        _current.set(self)
+        self._started = time.perf_counter()
+        self._started_wall = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.set(self._previous)
+        duration = time.perf_counter() - self._started
+        if exc_type is not None:
+            self.outcome = "error"
+        DOWNLOAD_SECONDS.observe(duration, platform=self.platform, method=self.method, outcome=self.outcome)
+        DOWNLOADS_TOTAL.inc(platform=self.platform, method=self.method, outcome=self.outcome)
+        if self.hook:
+            try:
+                self.hook(self.to_dict(duration))
+            except Exception as e:
+                print(f"Trace hook failed: {e}")
+        return False
+
+    def to_dict(self, duration: float) -> dict:
+        return {
+            "trace_id": self.id,
+            "url": self.url,
+            "platform": self.platform,
+            "method": self.method,
+            "outcome": self.outcome,
+            "start": self._started_wall,
+            "duration": duration,
+            "spans": self.spans,
+        }
+
+
+def annotate(**fields):
+    """Set attributes such as ``platform`` or ``method`` on the current trace."""
+    trace = current_trace()
+    if trace:
+        for name, value in fields.items():
+            setattr(trace, name, value)
+
+
+def trace_platform() -> str:
+    """Return the platform of the current download, for labelling metrics."""
+    trace = current_trace()
+    return trace.platform if trace else "unknown"
+
+
+@contextmanager
+def stage(name: str, method: str = ""):
+    """Time one stage of the current download.
+
+    Yields a dict whose ``outcome`` may be overwritten by the caller for
+    stages that report failure without raising.
+    """
+    trace = current_trace()
+    span = {"stage": name, "method": method, "outcome": "success", "start": time.time()}
+    started = time.perf_counter()
+    try:
+        yield span
+    except BaseException:
+        span["outcome"] = "error"
+        raise
+    finally:
+        span["duration"] = time.perf_counter() - started
+        platform = trace.platform if trace else "unknown"
+        STAGE_SECONDS.observe(span["duration"], stage=name, platform=platform, method=method,
+                              outcome=span["outcome"])
+        if trace:
+            trace.spans.append(span)
+
+
+class JsonlTraceWriter:
+    """Trace hook that appends each finished trace to a JSON-lines log file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, trace: dict):
+        line = json.dumps(trace)
+        with self._lock, open(self.path, "a") as f:
+            f.write(line + "\n")
@@ -0,0 +1,110 @@
+import codecs
+from html.parser import HTMLParser
+from typing import Optional
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+
+class PageMetadata:
+    """The og:/twitter: meta tags of a page, in document order."""
+
+    def __init__(self):
+        self.tags = {}
+        self.bytes_read = 0
+        self.complete = False
+
+    def add(self, key: str, value: str):
+        self.tags.setdefault(key, []).append(value)
+
+    def all(self, *keys: str) -> list:
+        """Return every value for the given keys, in the order the keys are listed."""
+        values = []
+        for key in keys:
+            values.extend(self.tags.get(key, []))
+        return values
+
+    def first(self, *keys: str) -> Optional[str]:
+        """Return the first value found for any of the given keys."""
+        values = self.all(*keys)
+        return values[0] if values else None
+
+    def __bool__(self):
+        return bool(self.tags)
+
+
+class _MetaTagParser(HTMLParser):
+    """Collects og:/twitter: meta tags and notes where the head ends."""
+
+    def __init__(self, page: PageMetadata):
+        super().__init__(convert_charrefs=True)
+        self.page = page
+        self.head_done = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'body':
+            self.head_done = True
+            return
+        if tag != 'meta':
+            return
+        attrs = dict(attrs)
+        key = attrs.get('property') or attrs.get('name')
+        content = attrs.get('content')
+        if key and content is not None and key.startswith(('og:', 'twitter:')):
+            self.page.add(key, content)
+
+    def handle_endtag(self, tag):
+        if tag == 'head':
+            self.head_done = True
+
+
+class PageHeadReader:
+    """Parses a page body fed in chunks and says when the head has been read.
+
+    The streaming half of ``fetch_page_metadata``, shared with callers that
+    read the body themselves (the asyncio engine).
+    """
+
+    def __init__(self, url: str, encoding: Optional[str] = None, max_bytes: int = 512 * 1024):
+        self.url = url
+        self.max_bytes = max_bytes
+        self.page = PageMetadata()
+        self._parser = _MetaTagParser(self.page)
+        try:
+            self._decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+        except LookupError:
+            self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def feed(self, chunk: bytes) -> bool:
+        """Parse the next chunk of the body; return True once reading can stop."""
+        self.page.bytes_read += len(chunk)
+        self._parser.feed(self._decoder.decode(chunk))
+        if self._parser.head_done:
+            self.page.complete = True
+            return True
+        if self.page.bytes_read >= self.max_bytes:
+            print(f"Stopped reading {self.url} after {self.page.bytes_read} bytes without finding </head>")
+            return True
+        return False
+
+    def finish(self) -> PageMetadata:
+        """Mark the page complete after the whole body was read, and return it."""
+        self.page.complete = True
+        return self.page
+
+
+def fetch_page_metadata(session, url: str, headers: Optional[dict] = None, max_bytes: int = 512 * 1024,
+                        chunk_size: int = 16 * 1024) -> PageMetadata:
+    """Stream a page and collect its og:/twitter: meta tags in a single pass.
+
+    Reading stops as soon as ``</head>`` (or ``<body>``) is seen or after
+    ``max_bytes``, so the megabytes of inline script that usually follow the
+    head are never downloaded.
+    """
+    with session.get(url, headers=headers or DEFAULT_HEADERS, stream=True) as response:
+        reader = PageHeadReader(url, response.encoding, max_bytes)
+        for chunk in response.iter_content(chunk_size):
+            if reader.feed(chunk):
+                return reader.page
+    return reader.finish()
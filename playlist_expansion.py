@@ -0,0 +1,172 @@
+import json
+import os
+import re
+import subprocess
+from contextlib import closing
+from datetime import datetime, timezone
+from typing import Callable, Iterator, Optional
+
+from download_index import media_key
+
+
+def parse_date(value: str) -> str:
+    """Normalise ``YYYYMMDD`` or ``YYYY-MM-DD`` to ``YYYYMMDD``."""
+    digits = value.replace("-", "")
+    datetime.strptime(digits, "%Y%m%d")
+    return digits
+
+
+def iter_flat_entries(url: str, start: Optional[int] = None, end: Optional[int] = None) -> Iterator[dict]:
+    """Yield the entries of a playlist, channel or listing as yt-dlp finds them.
+
+    Runs ``yt-dlp --flat-playlist --dump-json`` and parses its output one
+    line at a time, so the first entries are available while later pages
+    are still being fetched and memory does not grow with the listing.
+    ``start``/``end`` are 1-based, inclusive playlist indices.  Closing the
+    generator early kills the listing process.
+    """
+    command = ['yt-dlp', '--flat-playlist', '--dump-json', '--ignore-errors', '--no-warnings']
+    if start or end:
+        command += ['--playlist-items', f"{start or 1}:{end or ''}"]
+    command.append(url)
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                               text=True, errors='replace', bufsize=1)
+    found = 0
+    try:
+        for line in process.stdout:
+            line = line.strip()
+            if not line.startswith('{'):
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            found += 1
+            yield entry
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.stdout.close()
+        returncode = process.wait()
+    if returncode != 0 and not found:
+        raise IOError(f"yt-dlp could not list {url} (exit code {returncode})")
+
+
+def entry_url(entry: dict) -> Optional[str]:
+    """Return the page URL of a flat playlist entry."""
+    url = entry.get('webpage_url') or entry.get('url')
+    if url and not url.startswith(('http://', 'https://')):
+        # Older yt-dlp versions give bare YouTube video IDs
+        url = f"https://www.youtube.com/watch?v={url}" if entry.get('ie_key') == 'Youtube' else None
+    return url
+
+
+def entry_date(entry: dict) -> Optional[str]:
+    """Return an entry's upload date as ``YYYYMMDD``, if the listing includes one."""
+    if entry.get('upload_date'):
+        return entry['upload_date']
+    timestamp = entry.get('timestamp') or entry.get('release_timestamp')
+    if timestamp:
+        return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y%m%d")
+    return None
+
+
+def title_stems(title: str) -> set:
+    """File names (without extension) the downloader would give a video with this title."""
+    return {re.sub(r'[\\/*?:"<>|]', "", title), re.sub(r'[\\/*?:"<>|]', "_", title)[:100]}
+
+
+class PlaylistExpansion:
+    """Lazily expands a playlist, channel or listing URL into media URLs.
+
+    Iterating yields each entry's URL as soon as yt-dlp lists it, so feeding
+    the expansion to ``BatchDownloader.run`` starts downloads while the
+    listing is still being read.  Entries outside ``date_after``/
+    ``date_before`` (``YYYYMMDD``, inclusive) are dropped; entries without a
+    date in the flat listing are kept.  With ``skip_existing``, entries found
+    in the download index or under ``<output_dir>/<platform>/`` by title are
+    skipped.  At most ``limit`` URLs are yielded; the counters tell how the
+    rest were handled.
+    """
+
+    def __init__(self, downloader, url: str, selected_quality: str = "7", limit: Optional[int] = None,
+                 start: Optional[int] = None, end: Optional[int] = None, date_after: Optional[str] = None,
+                 date_before: Optional[str] = None, skip_existing: bool = True,
+                 on_skip: Optional[Callable[[str], None]] = None):
+        self.downloader = downloader
+        self.url = url
+        self.selected_quality = selected_quality
+        self.limit = limit
+        self.start = start
+        self.end = end
+        self.date_after = date_after
+        self.date_before = date_before
+        self.skip_existing = skip_existing
+        self.on_skip = on_skip
+        self.discovered = 0
+        self.queued = 0
+        self.skipped = 0
+        self.filtered = 0
+        self._names_on_disk = {}
+
+    def _in_range(self, entry: dict) -> bool:
+        date = entry_date(entry)
+        if date is None:
+            return True
+        if self.date_after and date < self.date_after:
+            return False
+        if self.date_before and date > self.date_before:
+            return False
+        return True
+
+    def _on_disk(self, platform: str) -> set:
+        """File names under ``<output_dir>/<platform>/``, scanned once per platform."""
+        names = self._names_on_disk.get(platform)
+        if names is None:
+            names = set()
+            platform_dir = os.path.join(self.downloader.output_dir, platform)
+            if os.path.isdir(platform_dir):
+                with os.scandir(platform_dir) as entries:
+                    for item in entries:
+                        stem, ext = os.path.splitext(item.name)
+                        if ext not in ('.part', '.json', '.ytdl', '.tmp'):
+                            names.add(stem)
+            self._names_on_disk[platform] = names
+        return names
+
+    def _exists(self, url: str, entry: dict) -> bool:
+        try:
+            platform = self.downloader.detect_platform(url)
+        except ValueError:
+            return False
+        if self.downloader.index.lookup(media_key(url, platform), self.selected_quality):
+            return True
+        title = entry.get('title')
+        return bool(title) and not title_stems(title).isdisjoint(self._on_disk(platform))
+
+    def __iter__(self) -> Iterator[str]:
+        if self.limit is not None and self.limit <= 0:
+            return
+        # Closing the listing kills yt-dlp as soon as the limit is reached
+        with closing(iter_flat_entries(self.url, self.start, self.end)) as entries:
+            for entry in entries:
+                url = entry_url(entry)
+                if not url:
+                    continue
+                self.discovered += 1
+                if not self._in_range(entry):
+                    self.filtered += 1
+                    continue
+                if self.skip_existing and self._exists(url, entry):
+                    self.skipped += 1
+                    if self.on_skip:
+                        self.on_skip(url)
+                    continue
+                self.queued += 1
+                yield url
+                if self.limit is not None and self.queued >= self.limit:
+                    return
+
+    def summary(self) -> dict:
+        return {"discovered": self.discovered, "queued": self.queued, "skipped": self.skipped,
+                "filtered": self.filtered}
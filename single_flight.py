@@ -0,0 +1,176 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process coalescing is available
+    fcntl = None
+
+
+class _Flight:
+    """One in-flight call and the callers waiting for it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.listeners = []
+
+    def publish(self, event: dict):
+        """Pass a progress event to every caller sharing this flight."""
+        for listener in list(self.listeners):
+            try:
+                listener(event)
+            except Exception as e:
+                print(f"Progress listener failed: {e}")
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one execution.
+
+    The first caller for a key runs the work; callers arriving while it is in
+    flight block until it finishes and get the same result (or exception).
+    Every caller's listener receives the progress the leader publishes.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def run(self, key: str, func: Callable[[Callable[[dict], None]], str],
+            listener: Optional[Callable[[dict], None]] = None) -> tuple:
+        """Run ``func(publish)`` once per key; return ``(result, shared)``.
+
+        ``shared`` is True for callers that waited on someone else's call.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            if listener:
+                flight.listeners.append(listener)
+
+        if not leader:
+            print(f"Waiting for in-flight download of {key}")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = func(flight.publish)
+            return flight.result, False
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def in_flight(self) -> int:
+        """Number of keys currently being worked on."""
+        with self._lock:
+            return len(self._flights)
+
+
+class AsyncSingleFlight:
+    """``SingleFlight`` for coroutines running on one event loop.
+
+    The leader's work runs as its own task, so a caller that is cancelled
+    does not cancel the download the other callers are waiting on.
+    """
+
+    def __init__(self):
+        self._flights = {}
+
+    async def run(self, key: str, func: Callable[[Callable[[dict], None]], Awaitable[str]],
+                  listener: Optional[Callable[[dict], None]] = None) -> tuple:
+        """Await ``func(publish)`` once per key; return ``(result, shared)``."""
+        import asyncio
+        entry = self._flights.get(key)
+        shared = entry is not None
+        if shared:
+            task, flight = entry
+            print(f"Waiting for in-flight download of {key}")
+        else:
+            flight = _Flight()
+            task = asyncio.ensure_future(func(flight.publish))
+            self._flights[key] = (task, flight)
+            task.add_done_callback(lambda _: self._flights.pop(key, None))
+        if listener:
+            flight.listeners.append(listener)
+        return await asyncio.shield(task), shared
+
+    def in_flight(self) -> int:
+        """Number of keys currently being worked on."""
+        return len(self._flights)
+
+
+class FileLock:
+    """Exclusive advisory lock shared by every process using the same directory.
+
+    Lock files live in ``directory`` under a hash of the key and are left in
+    place after release; deleting them would let two processes lock different
+    inodes for the same key.  Without ``fcntl`` (Windows) this is a no-op.
+    ``async with`` polls for the lock without blocking the event loop.
+    """
+
+    poll_interval = 0.2
+
+    def __init__(self, directory: str, key: str, timeout: Optional[float] = None):
+        self.path = os.path.join(directory, hashlib.sha1(key.encode()).hexdigest() + ".lock")
+        self.key = key
+        self.timeout = timeout
+        self.waited = False
+        self._file = None
+
+    def _open(self) -> Optional[float]:
+        """Open the lock file and return the deadline for acquiring it."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, 'a')
+        return time.monotonic() + self.timeout if self.timeout is not None else None
+
+    def _try_lock(self, deadline: Optional[float]) -> bool:
+        """Take the lock without blocking; raise TimeoutError once ``deadline`` has passed."""
+        if fcntl is None:
+            return True
+        try:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            pass
+        if not self.waited:
+            print(f"Waiting for another worker downloading {self.key}")
+            self.waited = True
+        if deadline is not None and time.monotonic() >= deadline:
+            self._file.close()
+            raise TimeoutError(f"Timed out waiting for the lock on {self.key}")
+        return False
+
+    def __enter__(self):
+        deadline = self._open()
+        while not self._try_lock(deadline):
+            time.sleep(self.poll_interval)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+        return False
+
+    async def __aenter__(self):
+        """Like ``__enter__``, but waits on the running event loop instead of blocking it."""
+        import asyncio
+        deadline = self._open()
+        while not self._try_lock(deadline):
+            await asyncio.sleep(self.poll_interval)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
@@ -34,12 +34,42 @@ document.addEventListener('DOMContentLoaded', function() {
     const urlInput = document.getElementById('url');
     const youtubeOptions = document.getElementById('youtube-options');
 
+    let formatsTimer = null;
+    let formatsUrl = null;
+
+    // Show only the quality options the video actually has
+    const loadFormats = function(url) {
+        formatsUrl = url;
+        fetch(`/formats?url=${encodeURIComponent(url)}`, { headers: { 'Accept': 'application/json' } })
+            .then(response => response.ok ? response.json() : null)
+            .then(data => {
+                if (!data || url !== formatsUrl) return;
+                const available = new Set(data.qualities.map(q => q.value));
+                document.querySelectorAll('input[name="quality"]').forEach(input => {
+                    const label = input.closest('label');
+                    label.classList.toggle('hidden', !available.has(input.value));
+                    if (!available.has(input.value) && input.checked) {
+                        document.querySelector('input[name="quality"][value="7"]').checked = true;
+                    }
+                });
+            })
+            .catch(err => console.error('Failed to load formats: ', err));
+    };
+
+    const showAllQualities = function() {
+        document.querySelectorAll('.quality-options label').forEach(label => label.classList.remove('hidden'));
+    };
+
     urlInput.addEventListener('input', function() {
         const url = urlInput.value.toLowerCase();
         const isYouTube = url.includes('youtube.com') || url.includes('youtu.be');
 
+        clearTimeout(formatsTimer);
+        formatsUrl = null;
+        showAllQualities();
         if (isYouTube) {
             youtubeOptions.classList.remove('hidden');
+            formatsTimer = setTimeout(() => loadFormats(urlInput.value.trim()), 600);
         } else {
             youtubeOptions.classList.add('hidden');
         }
@@ -50,6 +80,7 @@ document.addEventListener('DOMContentLoaded', function() {
         const isYouTube = url.includes('youtube.com') || url.includes('youtu.be');
         if (isYouTube) {
             youtubeOptions.classList.remove('hidden');
+            loadFormats(urlInput.value.trim());
         }
     }
 
@@ -98,6 +129,90 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    const jobStatus = document.getElementById('job-status');
+    if (jobStatus) {
+        const jobId = jobStatus.dataset.jobId;
+        const jobState = document.getElementById('job-state');
+        const jobResult = document.getElementById('job-result');
+        const stateIcon = jobStatus.querySelector('h2 i');
+
+        const formatBytes = function(bytes) {
+            if (bytes == null) return '?';
+            const units = ['B', 'KiB', 'MiB', 'GiB'];
+            let i = 0;
+            while (bytes >= 1024 && i < units.length - 1) {
+                bytes /= 1024;
+                i++;
+            }
+            return `${bytes.toFixed(1)} ${units[i]}`;
+        };
+
+        // Returns true once the job has reached a final state
+        const renderJob = function(job) {
+            const progress = job.progress;
+            if (progress && progress.percent != null) {
+                progressContainer.classList.remove('hidden');
+                downloadProgress.value = progress.percent;
+                progressPercentage.textContent = `${Math.round(progress.percent)}%`;
+            }
+
+            if (job.status === 'queued') {
+                jobState.textContent = 'Download queued';
+            } else if (job.status === 'running') {
+                const stage = progress && progress.stage ? progress.stage : 'starting';
+                jobState.textContent = `Downloading... (${stage})`;
+                if (progress && progress.stage === 'downloading') {
+                    const eta = progress.eta != null ? `, ETA ${progress.eta}s` : '';
+                    jobResult.textContent = `${formatBytes(progress.downloaded_bytes)} of ${formatBytes(progress.total_bytes)} at ${formatBytes(progress.speed)}/s${eta}`;
+                } else {
+                    jobResult.textContent = job.url;
+                }
+            } else if (job.status === 'finished') {
+                jobState.textContent = 'Download Complete';
+                jobResult.textContent = job.result;
+                stateIcon.className = 'fas fa-check-circle';
+                progressContainer.classList.add('hidden');
+                return true;
+            } else {
+                jobState.textContent = 'Download Failed';
+                jobResult.textContent = `Download failed: ${job.error || 'unknown error'}`;
+                stateIcon.className = 'fas fa-times-circle';
+                progressContainer.classList.add('hidden');
+                return true;
+            }
+            return false;
+        };
+
+        const pollJob = function() {
+            fetch(`/jobs/${jobId}`, { headers: { 'Accept': 'application/json' } })
+                .then(response => response.json())
+                .then(job => {
+                    if (!renderJob(job)) {
+                        setTimeout(pollJob, 2000);
+                    }
+                })
+                .catch(err => {
+                    console.error('Failed to fetch job status: ', err);
+                    setTimeout(pollJob, 5000);
+                });
+        };
+
+        if (window.EventSource) {
+            const events = new EventSource(`/jobs/${jobId}/events`);
+            events.onmessage = function(e) {
+                if (renderJob(JSON.parse(e.data))) {
+                    events.close();
+                }
+            };
+            events.onerror = function() {
+                events.close();
+                pollJob();
+            };
+        } else {
+            pollJob();
+        }
+    }
+
     const downloadAnotherBtn = document.getElementById('download-another');
     if (downloadAnotherBtn) {
         downloadAnotherBtn.addEventListener('click', function() {
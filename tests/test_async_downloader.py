@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from async_downloader import AsyncMediaDownloader
+from benchmarks.fake_services import FakePlatformServer, redirect_client_session, redirect_session
+from media_downloader import MediaDownloader
+
+
+@pytest.fixture(scope="module")
+def server():
+    server = FakePlatformServer(media_size=64 * 1024, page_padding=1024).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def downloader(server, tmp_path):
+    downloader = MediaDownloader(output_dir=str(tmp_path), show_progress=False)
+    redirect_session(downloader.session, server)
+    return downloader
+
+
+def run_handler(server, downloader, name, *args):
+    async def main():
+        async with AsyncMediaDownloader(downloader, session_factory=lambda: redirect_client_session(server)) as engine:
+            return await getattr(engine, name)(*args)
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("name, url", [
+    ("download_instagram", "https://www.instagram.com/p/abc/"),
+    ("download_reddit", "https://www.reddit.com/r/v/comments/abc/post/"),
+    ("download_tiktok", "https://www.tiktok.com/@user/video/123"),
+    ("download_instagram", "https://unknown.example/p/abc/"),
+])
+def test_async_handlers_match_the_threaded_ones(server, downloader, tmp_path, name, url):
+    expected = getattr(downloader, name)(url, str(tmp_path / "sync"))
+    result = run_handler(server, downloader, name, url, str(tmp_path / "async"))
+    assert result == expected.replace(str(tmp_path / "sync"), str(tmp_path / "async"))
@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+from batch_download import BatchDownloader
+from media_downloader import MediaDownloader
+
+
+class StubDownloader(MediaDownloader):
+    def __init__(self, output_dir: str):
+        super().__init__(output_dir=output_dir)
+
+    def download(self, url, selected_quality="7", output_name=None, progress=None, priority="interactive"):
+        if url.endswith("/missing"):
+            return "All download methods failed: no formats"
+        path = f"{self.output_dir}/{url.rsplit('/', 1)[-1]}.mp4"
+        with open(path, "w") as f:
+            f.write("data")
+        return f"Downloaded 1080p to {path}"
+
+
+def test_results_without_a_file_are_failed(tmp_path):
+    runner = BatchDownloader(StubDownloader(str(tmp_path)), max_workers=2)
+    items = {item["url"]: item for item in runner.run([
+        "https://www.instagram.com/p/abc",
+        "https://www.instagram.com/p/missing",
+    ])}
+    assert items["https://www.instagram.com/p/abc"]["status"] == "finished"
+    missing = items["https://www.instagram.com/p/missing"]
+    assert missing["status"] == "failed"
+    assert missing["error"] == "All download methods failed: no formats"
+    assert "result" not in missing
+
+
+class TimedDownloader(StubDownloader):
+    def __init__(self, output_dir: str):
+        super().__init__(output_dir)
+        self.started = []
+
+    def download(self, url, selected_quality="7", output_name=None, progress=None, priority="interactive"):
+        self.started.append(time.monotonic())
+        return super().download(url, selected_quality, output_name, progress, priority)
+
+
+def test_urls_are_dispatched_as_the_source_produces_them(tmp_path):
+    def slow_source():
+        for n in range(6):
+            time.sleep(0.1)
+            yield f"https://www.instagram.com/p/post{n}"
+
+    downloader = TimedDownloader(str(tmp_path))
+    runner = BatchDownloader(downloader, max_workers=2)
+    started = time.monotonic()
+    items = runner.run(slow_source())
+    first = next(items)
+    assert first["status"] == "finished"
+    # The first result arrives while the source is still listing
+    assert time.monotonic() - started < 0.4
+    assert downloader.started[0] - started < 0.3
+    assert len(list(items)) == 5
+
+
+def test_source_errors_are_raised_from_run(tmp_path):
+    def broken_source():
+        yield "https://www.instagram.com/p/abc"
+        raise IOError("listing failed")
+
+    runner = BatchDownloader(StubDownloader(str(tmp_path)), max_workers=2)
+    with pytest.raises(IOError, match="listing failed"):
+        list(runner.run(broken_source()))
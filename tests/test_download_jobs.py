@@ -0,0 +1,36 @@
+from download_jobs import DownloadJobQueue
+from media_downloader import MediaDownloader
+
+
+class StubDownloader(MediaDownloader):
+    def __init__(self, output_dir: str):
+        super().__init__(output_dir=output_dir)
+
+    def download(self, url, selected_quality="7", output_name=None, progress=None, priority="interactive"):
+        if url.endswith("/missing"):
+            return "No media found in Instagram post"
+        path = f"{self.output_dir}/video.mp4"
+        with open(path, "w") as f:
+            f.write("data")
+        return f"Downloaded 1080p to {path}"
+
+
+def run_job(tmp_path, url):
+    queue = DownloadJobQueue(StubDownloader(str(tmp_path)), workers=1)
+    job = queue.submit(url)
+    assert job.done.wait(5)
+    return job
+
+
+def test_download_with_a_file_finishes(tmp_path):
+    job = run_job(tmp_path, "https://www.instagram.com/p/abc")
+    assert job.status == "finished"
+    assert job.result.startswith("Downloaded 1080p to ")
+    assert job.error is None
+
+
+def test_result_without_a_file_fails(tmp_path):
+    job = run_job(tmp_path, "https://www.instagram.com/p/missing")
+    assert job.status == "failed"
+    assert job.result is None
+    assert job.error == "No media found in Instagram post"
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+import requests
+
+from benchmarks.fake_services import FakePlatformServer, media_url, redirect_session
+from file_transfer import SegmentedDownload, stream_download
+
+
+@pytest.fixture(scope="module")
+def server():
+    server = FakePlatformServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def session(server):
+    session = requests.Session()
+    redirect_session(session, server)
+    return session
+
+
+def test_small_file_costs_one_request(server, session, tmp_path):
+    before = server.request_count
+    size = stream_download(session, media_url(4096, "jpg"), str(tmp_path / "a.jpg"), show_progress=False,
+                           segments=4, segment_min_size=1024 * 1024)
+    assert size == 4096
+    assert server.request_count - before == 1
+    assert (tmp_path / "a.jpg").read_bytes() == server.media_bytes(4096)
+
+
+def test_large_file_is_segmented(server, session, tmp_path):
+    before = server.request_count
+    size = 2 * 1024 * 1024
+    stream_download(session, media_url(size), str(tmp_path / "b.mp4"), show_progress=False,
+                    segments=4, segment_min_size=1024 * 1024)
+    assert server.request_count - before == 5
+    assert (tmp_path / "b.mp4").read_bytes() == server.media_bytes(size)
+    assert not (tmp_path / "b.mp4.part").exists()
+    assert not (tmp_path / "b.mp4.part.json").exists()
+
+
+def test_sidecar_from_another_url_is_not_resumed(server, session, tmp_path):
+    size = 64 * 1024
+    output = tmp_path / "c.mp4"
+    # A finished-looking leftover of the same size, written for a different URL
+    (tmp_path / "c.mp4.part").write_bytes(b"\0" * size)
+    (tmp_path / "c.mp4.part.json").write_text(json.dumps(
+        {"url": "https://cdn.bench/media/other.mp4", "size": size, "ranges": [[0, size - 1, size]]}))
+    SegmentedDownload(session, media_url(size), str(output), size, segments=2, show_progress=False).run()
+    assert output.read_bytes() == server.media_bytes(size)
@@ -0,0 +1,55 @@
+import pytest
+
+from media_downloader import MediaDownloader
+from media_formats import select_format
+
+COMBINED_360 = {"format_id": "18", "height": 360, "vcodec": "avc1", "acodec": "mp4a", "tbr": 500}
+VIDEO_720 = {"format_id": "136", "height": 720, "vcodec": "avc1", "acodec": "none", "tbr": 1500}
+VIDEO_1080 = {"format_id": "137", "height": 1080, "vcodec": "avc1", "acodec": "none", "tbr": 3000}
+AUDIO_LOW = {"format_id": "139", "vcodec": "none", "acodec": "mp4a", "abr": 48}
+AUDIO_HIGH = {"format_id": "140", "vcodec": "none", "acodec": "mp4a", "abr": 128}
+FORMATS = [COMBINED_360, VIDEO_720, VIDEO_1080, AUDIO_LOW, AUDIO_HIGH]
+
+
+def test_select_format_prefers_combined_stream():
+    assert select_format(FORMATS, 1080) == {"format_id": "18", "height": 360, "label": "360p"}
+
+
+def test_select_format_falls_back_to_smallest_when_all_are_taller():
+    assert select_format(FORMATS, 144)["format_id"] == "18"
+
+
+def test_select_format_merges_best_audio_with_matching_video():
+    selection = select_format([VIDEO_720, VIDEO_1080, AUDIO_LOW, AUDIO_HIGH], 720)
+    assert selection == {"format_id": "136+140", "height": 720, "label": "720p"}
+
+
+def test_select_format_without_merge():
+    assert select_format([VIDEO_720, AUDIO_HIGH], 720, allow_merge=False) is None
+    assert select_format([], None) is None
+
+
+@pytest.fixture
+def downloader(tmp_path, monkeypatch):
+    downloader = MediaDownloader(output_dir=str(tmp_path), show_progress=False)
+    monkeypatch.setattr(downloader, "get_metadata", lambda url: {"formats": downloader.formats})
+    return downloader
+
+
+def test_available_qualities_lists_each_delivered_resolution_once(downloader):
+    downloader.formats = FORMATS
+    qualities = downloader.available_qualities("https://www.youtube.com/watch?v=x")
+    assert [(q["resolution"], q["delivers"]) for q in qualities] == [("360p", "360p"), ("Best available", "360p")]
+
+
+def test_available_qualities_with_separate_streams(downloader):
+    downloader.formats = [VIDEO_720, VIDEO_1080, AUDIO_HIGH]
+    qualities = downloader.available_qualities("https://www.youtube.com/watch?v=x")
+    assert [(q["resolution"], q["delivers"]) for q in qualities] == [
+        ("720p", "720p"), ("1080p", "1080p"), ("Best available", "1080p")]
+
+
+def test_available_qualities_without_metadata(downloader, monkeypatch):
+    monkeypatch.setattr(downloader, "get_metadata", lambda url: None)
+    with pytest.raises(ValueError):
+        downloader.available_qualities("https://www.youtube.com/watch?v=x")
@@ -0,0 +1,93 @@
+import pytest
+
+import method_router
+from method_router import CircuitBreaker, MethodRouter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def test_circuit_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=10)
+    for _ in range(2):
+        breaker.record(False, 0)
+    assert breaker.allow(0)
+    breaker.record(False, 0)
+    assert breaker.state == "open"
+    assert not breaker.allow(5)
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=10)
+    breaker.record(False, 0)
+    assert breaker.allow(10)
+    assert breaker.state == "half_open"
+    assert not breaker.allow(11)
+    breaker.record(True, 12)
+    assert breaker.state == "closed"
+    assert breaker.allow(12)
+
+
+def test_failed_probe_doubles_cooldown_up_to_max():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=10, max_cooldown=15)
+    breaker.record(False, 0)
+    assert breaker.allow(10)
+    breaker.record(False, 10)
+    assert breaker.cooldown == 15
+    assert not breaker.allow(24)
+    assert breaker.allow(25)
+
+
+@pytest.fixture
+def router():
+    return MethodRouter(min_samples=2, explore_every=0, failure_threshold=3)
+
+
+def test_router_keeps_default_order_until_min_samples(router):
+    router.record("instagram", "ytdlp", False, 1)
+    assert router.order("instagram", ["ytdlp", "fallback"]) == ["ytdlp", "fallback"]
+
+
+def test_router_prefers_the_more_reliable_method(router):
+    for _ in range(2):
+        router.record("instagram", "ytdlp", False, 1)
+        router.record("instagram", "fallback", True, 1)
+    assert router.order("instagram", ["ytdlp", "fallback"]) == ["fallback", "ytdlp"]
+
+
+def test_router_skips_open_circuit_but_never_returns_nothing(router):
+    for _ in range(3):
+        router.record("instagram", "ytdlp", False, 1)
+    assert router.order("instagram", ["ytdlp", "fallback"]) == ["fallback"]
+    for _ in range(3):
+        router.record("instagram", "fallback", False, 1)
+    assert router.order("instagram", ["ytdlp", "fallback"]) == ["ytdlp", "fallback"]
+
+
+def test_router_explores_the_default_order():
+    router = MethodRouter(min_samples=1, explore_every=2)
+    router.record("reddit", "ytdlp", False, 1)
+    router.record("reddit", "fallback", True, 1)
+    assert router.order("reddit", ["ytdlp", "fallback"]) == ["fallback", "ytdlp"]
+    assert router.order("reddit", ["ytdlp", "fallback"]) == ["ytdlp", "fallback"]
+
+
+def test_listing_a_half_open_method_does_not_claim_its_probe(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(method_router, "time", clock)
+    router = MethodRouter(failure_threshold=1, cooldown=10, explore_every=0)
+    router.record("instagram", "ytdlp", False, 1)
+    router.record("instagram", "fallback", False, 1)
+    clock.now += 10
+    assert router.order("instagram", ["ytdlp", "fallback"]) == ["ytdlp", "fallback"]
+    assert router.begin("instagram", "ytdlp")
+    router.record("instagram", "ytdlp", True, 1)
+    # The fallback was listed but never tried, so its probe is still free
+    assert router.order("instagram", ["ytdlp", "fallback"]) == ["fallback", "ytdlp"]
+    assert router.begin("instagram", "fallback")
+    assert not router.begin("instagram", "fallback")
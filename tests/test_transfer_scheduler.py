@@ -0,0 +1,152 @@
+import asyncio
+import threading
+
+import pytest
+
+import transfer_scheduler
+from transfer_scheduler import TokenBucket, TransferScheduler, _HostState, current_priority, priority_class
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(transfer_scheduler, "time", clock)
+    return clock
+
+
+def test_token_bucket_borrows_and_refills(clock):
+    bucket = TokenBucket(rate=100)
+    assert bucket.reserve(100) == 0
+    assert bucket.reserve(50) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.reserve(0) == 0
+    assert not bucket.idle()
+    clock.now += 1
+    assert bucket.idle()
+
+
+def test_token_bucket_consume_sleeps_off_debt(clock):
+    bucket = TokenBucket(rate=100, burst=10)
+    assert bucket.consume(60) == pytest.approx(0.5)
+    assert clock.slept == [pytest.approx(0.5)]
+
+
+def test_host_bucket_survives_idle_host(clock):
+    scheduler = TransferScheduler(host_rate=100)
+    with scheduler.transfer("https://cdn.example/a") as transfer:
+        transfer.consume(100)
+    assert clock.slept == []
+    # A new transfer to the same host must not start with a fresh burst
+    with scheduler.transfer("https://cdn.example/b") as transfer:
+        transfer.consume(100)
+    assert clock.slept == [pytest.approx(1.0)]
+
+
+def test_wait_is_longest_bucket_not_sum(clock):
+    scheduler = TransferScheduler(global_rate=100, host_rate=100)
+    assert scheduler.reserve("cdn.example", "interactive", 200) == pytest.approx(1.0)
+
+
+def test_bulk_share_applies_only_while_interactive_runs(clock):
+    scheduler = TransferScheduler(global_rate=1000, bulk_share=0.1)
+    assert scheduler.reserve("cdn.example", "bulk", 1000) == 0
+    clock.now += 10
+    with scheduler.transfer("https://other.example/", "interactive"):
+        # 1000 bytes against a 100 B/s bulk bucket holding 100
+        assert scheduler.reserve("cdn.example", "bulk", 1000) == pytest.approx(9.0)
+
+
+def test_may_start_priority_rules():
+    scheduler = TransferScheduler(host_connections=4, bulk_share=0.25)
+    state = _HostState()
+    assert scheduler._may_start(state, "bulk")
+    state.active["bulk"] = 1
+    assert scheduler._may_start(state, "interactive")
+    # Bulk is limited to its share of the slots...
+    assert not scheduler._may_start(state, "bulk")
+    state.active["bulk"] = 0
+    state.active["interactive"] = 3
+    state.waiting["interactive"] = 1
+    # ...but one bulk transfer per host may always run
+    assert scheduler._may_start(state, "bulk")
+    state.active["bulk"] = 1
+    assert not scheduler._may_start(state, "interactive")
+
+
+def test_transfer_waits_for_free_slot():
+    scheduler = TransferScheduler(host_connections=1)
+    started = threading.Event()
+    with scheduler.transfer("https://cdn.example/a"):
+        thread = threading.Thread(target=lambda: scheduler.transfer("https://cdn.example/b").__enter__()
+                                  and started.set())
+        thread.start()
+        assert not started.wait(0.2)
+        assert scheduler.snapshot()["hosts"]["cdn.example"]["waiting"]["interactive"] == 1
+    assert started.wait(2)
+    thread.join()
+
+
+def test_priority_class():
+    assert current_priority() == "interactive"
+    with priority_class("bulk"):
+        assert current_priority() == "bulk"
+    assert current_priority() == "interactive"
+    with pytest.raises(ValueError):
+        with priority_class("urgent"):
+            pass
+
+
+def test_async_transfer_shares_slots_with_threads():
+    scheduler = TransferScheduler(host_connections=2, bulk_share=0.5)
+    order = []
+
+    async def fetch(name, priority):
+        async with scheduler.async_transfer(f"https://cdn.example/{name}", priority):
+            order.append(name)
+            await asyncio.sleep(0.05)
+
+    async def main():
+        with scheduler.transfer("https://cdn.example/a", "bulk"):
+            with scheduler.transfer("https://cdn.example/b"):
+                bulk = asyncio.ensure_future(fetch("bulk", "bulk"))
+                interactive = asyncio.ensure_future(fetch("interactive", "interactive"))
+                await asyncio.sleep(0.05)
+                assert order == []
+                assert scheduler.snapshot()["hosts"]["cdn.example"]["waiting"] == {"interactive": 1, "bulk": 1}
+            # The freed slot goes to the interactive transfer; bulk already has its share
+            await asyncio.wait_for(interactive, 2)
+            assert order == ["interactive"]
+        await asyncio.wait_for(bulk, 2)
+
+    asyncio.run(main())
+    assert order == ["interactive", "bulk"]
+    assert scheduler.snapshot()["hosts"] == {}
+
+
+def test_cancelled_async_waiter_gives_up_its_place():
+    scheduler = TransferScheduler(host_connections=1)
+
+    async def main():
+        with scheduler.transfer("https://cdn.example/a"):
+            task = asyncio.ensure_future(scheduler.async_transfer("https://cdn.example/b").__aenter__())
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert scheduler.snapshot()["hosts"]["cdn.example"]["waiting"]["interactive"] == 0
+
+    asyncio.run(main())
+    assert scheduler.snapshot()["hosts"] == {}
@@ -0,0 +1,307 @@
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from urllib.parse import urlparse
+
+from metrics import SCHEDULED_BYTES_TOTAL, THROTTLE_SECONDS_TOTAL
+
+PRIORITIES = ("interactive", "bulk")
+# Host buckets kept for idle hosts before the full ones are dropped
+MAX_HOST_BUCKETS = 256
+
+_priority = ContextVar("transfer_priority", default="interactive")
+
+
+def current_priority() -> str:
+    """Return the priority class of the download running in this thread or task."""
+    return _priority.get()
+
+
+@contextmanager
+def priority_class(priority: str):
+    """Run the enclosed download under ``priority`` ("interactive" or "bulk")."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority class: {priority}")
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Rate limiter that lets a caller borrow tokens and sleep off the debt.
+
+    ``consume`` always succeeds; if the bucket goes negative the caller sleeps
+    until it would have refilled, so concurrent callers share ``rate`` in the
+    order they asked.  ``burst`` caps how much unused allowance builds up.
+    ``reserve`` takes the tokens without sleeping, for callers that wait in
+    their own way (an event loop).
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Take ``amount`` tokens and return how long the caller must wait before using them."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def consume(self, amount: float) -> float:
+        """Take ``amount`` tokens, sleeping as long as needed; return the time slept."""
+        wait = self.reserve(amount)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def idle(self) -> bool:
+        """True once the bucket has refilled completely."""
+        return self.tokens + (time.monotonic() - self.updated) * self.rate >= self.burst
+
+
+class _HostState:
+    def __init__(self):
+        self.active = dict.fromkeys(PRIORITIES, 0)
+        self.waiting = dict.fromkeys(PRIORITIES, 0)
+        self.async_waiters = []
+
+
+class _AsyncWaiter:
+    """A coroutine waiting in ``async_transfer``; ``granted`` once a slot was handed to it."""
+
+    def __init__(self, priority: str, loop):
+        self.priority = priority
+        self.loop = loop
+        self.future = loop.create_future()
+        self.granted = False
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class Transfer:
+    """A connection slot held for one transfer; ``consume`` applies the bandwidth caps."""
+
+    def __init__(self, scheduler: "TransferScheduler", host: str, priority: str):
+        self.scheduler = scheduler
+        self.host = host
+        self.priority = priority
+
+    def consume(self, amount: int):
+        wait = self.scheduler.reserve(self.host, self.priority, amount)
+        if wait:
+            time.sleep(wait)
+
+
+class TransferScheduler:
+    """Shares bandwidth and connections between every download in the process.
+
+    * ``global_rate`` and ``host_rate`` (bytes/s, None for unlimited) are
+      enforced with token buckets on every byte read by ``_download_file``.
+    * At most ``host_connections`` transfers run against one host at once.
+      Waiting interactive transfers are started before bulk ones, and bulk
+      transfers use at most ``bulk_share`` of the slots, but one bulk
+      transfer per host may always run so batches never starve.
+    * While interactive transfers are running, bulk ones together get at most
+      ``bulk_share`` of ``global_rate``.
+    * yt-dlp cannot be throttled from here, so ``ytdlp_rate_limit`` gives
+      the cap to pass as ``--limit-rate`` instead.
+    * The asyncio engine takes the same slots with ``async_transfer``,
+      which waits without blocking its event loop, and charges its bytes to
+      the caps with ``reserve``, sleeping on the loop.
+    """
+
+    def __init__(self, global_rate: Optional[float] = None, host_rate: Optional[float] = None,
+                 host_connections: int = 8, bulk_share: float = 0.25):
+        self.global_rate = global_rate
+        self.host_rate = host_rate
+        self.host_connections = host_connections
+        self.bulk_share = bulk_share
+        self.bulk_connections = max(1, int(host_connections * bulk_share))
+        self._global_bucket = TokenBucket(global_rate) if global_rate else None
+        self._bulk_bucket = TokenBucket(global_rate * bulk_share) if global_rate else None
+        self._hosts = {}
+        self._host_buckets = {}
+        self._cond = threading.Condition()
+
+    def _host(self, host: str) -> _HostState:
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState()
+        return state
+
+    def _host_bucket(self, host: str) -> TokenBucket:
+        with self._cond:
+            bucket = self._host_buckets.get(host)
+            if bucket is None:
+                if len(self._host_buckets) >= MAX_HOST_BUCKETS:
+                    # A full bucket carries no debt, so dropping it changes nothing
+                    self._host_buckets = {name: b for name, b in self._host_buckets.items() if not b.idle()}
+                bucket = self._host_buckets[host] = TokenBucket(self.host_rate)
+            return bucket
+
+    def _may_start(self, state: _HostState, priority: str) -> bool:
+        if sum(state.active.values()) >= self.host_connections:
+            return False
+        if priority == "interactive" or state.active["bulk"] == 0:
+            return True
+        return not state.waiting["interactive"] and state.active["bulk"] < self.bulk_connections
+
+    def _interactive_active(self) -> bool:
+        return any(state.active["interactive"] for state in self._hosts.values())
+
+    @contextmanager
+    def transfer(self, url: str, priority: Optional[str] = None):
+        """Hold a connection slot on the URL's host for the enclosed transfer."""
+        priority = priority or current_priority()
+        host = urlparse(url).hostname or ""
+        with self._cond:
+            state = self._host(host)
+            state.waiting[priority] += 1
+            try:
+                while not self._may_start(state, priority):
+                    self._cond.wait()
+            finally:
+                state.waiting[priority] -= 1
+            state.active[priority] += 1
+        try:
+            yield Transfer(self, host, priority)
+        finally:
+            self._release(host, state, priority)
+
+    @asynccontextmanager
+    async def async_transfer(self, url: str, priority: Optional[str] = None):
+        """``transfer`` for coroutines: waits for the slot without blocking the event loop.
+
+        Async and threaded transfers share the slots and the priority rules.
+        A freed slot is handed straight to one waiting coroutine, so a
+        release does not wake every task queued on the host.
+        """
+        import asyncio
+        priority = priority or current_priority()
+        host = urlparse(url).hostname or ""
+        waiter = None
+        with self._cond:
+            state = self._host(host)
+            if self._may_start(state, priority):
+                state.active[priority] += 1
+            else:
+                state.waiting[priority] += 1
+                waiter = _AsyncWaiter(priority, asyncio.get_running_loop())
+                state.async_waiters.append(waiter)
+        if waiter:
+            try:
+                await waiter.future
+            except BaseException:
+                with self._cond:
+                    if waiter.granted:
+                        state.active[priority] -= 1
+                    else:
+                        state.async_waiters.remove(waiter)
+                        state.waiting[priority] -= 1
+                    self._forget_if_idle(host, state)
+                    self._notify(state)
+                raise
+        try:
+            yield Transfer(self, host, priority)
+        finally:
+            self._release(host, state, priority)
+
+    def _release(self, host: str, state: _HostState, priority: str):
+        with self._cond:
+            state.active[priority] -= 1
+            self._notify(state)
+            self._forget_if_idle(host, state)
+
+    def _forget_if_idle(self, host: str, state: _HostState):
+        # Forget idle hosts so CDN edge names do not pile up
+        if not any(state.active.values()) and not any(state.waiting.values()):
+            self._hosts.pop(host, None)
+
+    def _notify(self, state: _HostState):
+        """Give free slots on a host to waiting coroutines, interactive first, and wake waiting threads.
+
+        Call with ``_cond`` held.
+        """
+        for priority in PRIORITIES:
+            for waiter in [waiter for waiter in state.async_waiters if waiter.priority == priority]:
+                if not self._may_start(state, priority):
+                    break
+                state.async_waiters.remove(waiter)
+                state.waiting[priority] -= 1
+                state.active[priority] += 1
+                waiter.granted = True
+                try:
+                    waiter.loop.call_soon_threadsafe(_wake, waiter.future)
+                except RuntimeError:
+                    # The waiter's event loop has been closed
+                    state.active[priority] -= 1
+        self._cond.notify_all()
+
+    def reserve(self, host: str, priority: str, amount: int) -> float:
+        """Charge ``amount`` bytes read from ``host`` to the caps; return how long to wait.
+
+        The buckets refill side by side, so the wait is the longest of theirs.
+        """
+        waits = [0.0]
+        if self._global_bucket:
+            waits.append(self._global_bucket.reserve(amount))
+        if priority == "bulk" and self._bulk_bucket:
+            with self._cond:
+                contended = self._interactive_active()
+            if contended:
+                waits.append(self._bulk_bucket.reserve(amount))
+        if self.host_rate:
+            waits.append(self._host_bucket(host).reserve(amount))
+        wait = max(waits)
+        SCHEDULED_BYTES_TOTAL.inc(amount, priority=priority)
+        if wait:
+            THROTTLE_SECONDS_TOTAL.inc(wait, priority=priority)
+        return wait
+
+    def ytdlp_rate_limit(self, url: str, priority: Optional[str] = None) -> Optional[int]:
+        """Return the bytes/s to pass to yt-dlp's ``--limit-rate``, or None for no cap.
+
+        yt-dlp gets an equal share of the global rate among the transfers
+        running when it starts, capped by the per-host rate.
+        """
+        priority = priority or current_priority()
+        limits = []
+        if self.host_rate:
+            limits.append(self.host_rate)
+        if self.global_rate:
+            with self._cond:
+                running = sum(sum(state.active.values()) for state in self._hosts.values())
+                contended = self._interactive_active()
+            share = self.global_rate / max(1, running)
+            if priority == "bulk" and contended:
+                share = min(share, self.global_rate * self.bulk_share)
+            limits.append(share)
+        return int(min(limits)) if limits else None
+
+    def snapshot(self) -> dict:
+        """Return active and waiting transfers per host and priority, plus the limits."""
+        with self._cond:
+            hosts = {
+                host: {"active": dict(state.active), "waiting": dict(state.waiting)}
+                for host, state in self._hosts.items()
+            }
+        return {
+            "global_rate": self.global_rate,
+            "host_rate": self.host_rate,
+            "host_connections": self.host_connections,
+            "bulk_share": self.bulk_share,
+            "hosts": hosts,
+        }
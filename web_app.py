@@ -0,0 +1,229 @@
+import json
+import os
+import threading
+from typing import Optional
+from urllib.parse import quote
+
+from flask import Flask, render_template, request, url_for, jsonify, Response, stream_with_context
+
+from batch_download import BatchDownloader, read_urls
+from download_jobs import DownloadJobQueue, QueueFullError
+from media_downloader import downloader_from_env
+from metrics import REGISTRY, Gauge
+from playlist_expansion import PlaylistExpansion, parse_date
+
+# Importing this module builds the shared downloader and job queue from the
+# DOWNLOAD_* environment.  Serve it with ``python -m media_downloader serve``
+# or point a WSGI server at ``web_app:app`` (``media_downloader:app`` also works).
+# DOWNLOAD_ENGINE=asyncio runs downloads on the asyncio engine (needs aiohttp).
+app = Flask(__name__)
+
+downloader = downloader_from_env()
+if os.environ.get("DOWNLOAD_ENGINE") == "asyncio":
+    # Fallback downloads share one event loop and aiohttp connection pool
+    from async_downloader import BlockingAsyncDownloader
+    downloader = BlockingAsyncDownloader(downloader)
+job_queue = DownloadJobQueue(
+    downloader,
+    workers=int(os.environ.get("DOWNLOAD_WORKERS", "4")),
+    max_queued=int(os.environ.get("DOWNLOAD_QUEUE_SIZE", "32")),
+)
+
+JOB_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "media_downloader_job_queue_depth", "Jobs waiting for a download worker."))
+JOBS_BY_STATUS = REGISTRY.register(Gauge(
+    "media_downloader_jobs", "Jobs currently tracked by the queue, by status.", ("status",)))
+METHOD_SUCCESS_RATE = REGISTRY.register(Gauge(
+    "media_downloader_method_success_rate", "Recent success rate of each download method.", ("platform", "method")))
+CIRCUIT_OPEN = REGISTRY.register(Gauge(
+    "media_downloader_circuit_open", "1 while a method's circuit breaker is open or half-open.", ("platform", "method")))
+TRANSFERS_ACTIVE = REGISTRY.register(Gauge(
+    "media_downloader_transfers_active", "Transfers holding a connection slot, by host and priority.",
+    ("host", "priority")))
+TRANSFERS_WAITING = REGISTRY.register(Gauge(
+    "media_downloader_transfers_waiting", "Transfers waiting for a connection slot, by host and priority.",
+    ("host", "priority")))
+
+batch_downloader = BatchDownloader(downloader, max_workers=int(os.environ.get("DOWNLOAD_BATCH_WORKERS", "8")))
+# /stream and /formats run yt-dlp on the request thread rather than in the
+# job queue, so they share their own fixed number of slots
+request_slots = threading.BoundedSemaphore(int(os.environ.get("DOWNLOAD_REQUEST_SLOTS", "4")))
+BUSY_MESSAGE = "Too many streams and format lookups in progress, try again shortly"
+
+def _wants_json() -> bool:
+    """Return True when the client asked for a JSON response."""
+    return request.is_json or request.accept_mimetypes.best == 'application/json'
+
+@app.route('/')
+def index():
+    return render_template('index.html')
+
+@app.route('/download', methods=['POST'])
+def download():
+    data = request.get_json(silent=True) or request.form
+    url = data.get('url')
+    selected_quality = data.get('selected_quality', '7')
+    if not url:
+        if _wants_json():
+            return jsonify(error="Missing url"), 400
+        return render_template('index.html', result="Download failed: missing URL"), 400
+    try:
+        job = job_queue.submit(url, selected_quality)
+    except QueueFullError as e:
+        if _wants_json():
+            return jsonify(error=str(e)), 503, {'Retry-After': '30'}
+        return render_template('index.html', result=f"Download failed: {e}"), 503, {'Retry-After': '30'}
+    if _wants_json():
+        return jsonify(job.to_dict()), 202, {'Location': url_for('job_status', job_id=job.id)}
+    return render_template('index.html', job=job.to_dict()), 202
+
+def _optional_int(data: dict, name: str, minimum: int) -> Optional[int]:
+    """Read an optional integer field of a JSON body, raising ValueError if it is not one."""
+    value = data.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an integer") from None
+    if number < minimum:
+        raise ValueError(f"{name} must be at least {minimum}")
+    return number
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    data = request.get_json(silent=True)
+    expansion = None
+    if data is not None and data.get('playlist'):
+        selected_quality = data.get('selected_quality', '7')
+        try:
+            limit = _optional_int(data, 'limit', 0)
+            start = _optional_int(data, 'start', 1)
+            end = _optional_int(data, 'end', 1)
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+        try:
+            expansion = urls = PlaylistExpansion(
+                downloader, data['playlist'], selected_quality, limit=limit, start=start, end=end,
+                date_after=parse_date(data['date_after']) if data.get('date_after') else None,
+                date_before=parse_date(data['date_before']) if data.get('date_before') else None,
+                skip_existing=not data.get('redownload'))
+        except ValueError as e:
+            return jsonify(error=f"Invalid date: {e}"), 400
+    elif data is not None:
+        urls = data.get('urls') or []
+        selected_quality = data.get('selected_quality', '7')
+    else:
+        urls = list(read_urls(request.get_data(as_text=True).splitlines()))
+        selected_quality = request.args.get('selected_quality', '7')
+    if not urls:
+        return jsonify(error="No URLs given"), 400
+
+    def generate():
+        try:
+            for item in batch_downloader.run(urls, selected_quality):
+                yield json.dumps(item) + "\n"
+        except IOError as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+        if expansion is not None:
+            yield json.dumps({"summary": expansion.summary()}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/formats')
+def formats():
+    url = request.args.get('url')
+    if not url:
+        return jsonify(error="Missing url"), 400
+    if not request_slots.acquire(blocking=False):
+        return jsonify(error=BUSY_MESSAGE), 503, {'Retry-After': '5'}
+    try:
+        qualities = downloader.available_qualities(url)
+    except Exception as e:
+        return jsonify(error=str(e)), 502
+    finally:
+        request_slots.release()
+    return jsonify(url=url, qualities=qualities)
+
+@app.route('/stream')
+def stream():
+    url = request.args.get('url')
+    selected_quality = request.args.get('selected_quality', '7')
+    save_to_disk = request.args.get('save', '').lower() in ('1', 'true', 'yes')
+    if not url:
+        return jsonify(error="Missing url"), 400
+    if not request_slots.acquire(blocking=False):
+        return jsonify(error=BUSY_MESSAGE), 503, {'Retry-After': '30'}
+    try:
+        media = downloader.open_stream(url, selected_quality, save_to_disk=save_to_disk)
+    except Exception as e:
+        request_slots.release()
+        return jsonify(error=f"Stream failed: {e}"), 502
+
+    ascii_name = media.filename.encode('ascii', 'ignore').decode().replace('"', '') or 'media'
+    headers = {
+        'Content-Disposition': f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(media.filename)}",
+    }
+    if media.content_length is not None:
+        headers['Content-Length'] = str(media.content_length)
+    response = Response(stream_with_context(media.chunks), mimetype=media.content_type, headers=headers)
+    # The slot stays taken until the body has been sent or the client went away
+    response.call_on_close(request_slots.release)
+    return response
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify(error="Unknown job"), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify(error="Unknown job"), 404
+
+    def generate():
+        version = -1
+        while True:
+            new_version = job.wait_for_change(version)
+            if new_version == version:
+                yield ": keep-alive\n\n"
+                continue
+            version = new_version
+            yield f"data: {json.dumps(job.to_dict())}\n\n"
+            if job.done.is_set():
+                return
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics')
+def metrics():
+    stats = job_queue.stats()
+    JOB_QUEUE_DEPTH.set(stats["queued"])
+    for status in ("queued", "running", "finished", "failed"):
+        JOBS_BY_STATUS.set(stats["jobs"].get(status, 0), status=status)
+    for route, stats in downloader.router.snapshot().items():
+        platform, method = route.split("/")
+        METHOD_SUCCESS_RATE.set(stats["success_rate"], platform=platform, method=method)
+        CIRCUIT_OPEN.set(0 if stats["circuit"] == "closed" else 1, platform=platform, method=method)
+    # Idle hosts drop out of the snapshot, so rebuild these gauges from scratch
+    TRANSFERS_ACTIVE.clear()
+    TRANSFERS_WAITING.clear()
+    for host, state in downloader.scheduler.snapshot()["hosts"].items():
+        for priority, count in state["active"].items():
+            TRANSFERS_ACTIVE.set(count, host=host, priority=priority)
+        for priority, count in state["waiting"].items():
+            TRANSFERS_WAITING.set(count, host=host, priority=priority)
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/scheduler')
+def scheduler_state():
+    return jsonify(downloader.scheduler.snapshot())
+
+@app.route('/jobs')
+def jobs_summary():
+    return jsonify(job_queue.stats())
+